@@ -0,0 +1,61 @@
+"""
+Shared pytest configuration for the genomeQC tests
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from genomeQC import GenomeQC, build_parser
+
+# RAM-backed scratch space for the small FASTA files and PBS scripts the tests write
+TMPFS_DIR = '/dev/shm'
+
+REPO_DIR = Path(__file__).parent
+
+
+def pytest_configure(config):
+    """Put temporary directories on tmpfs unless TMPDIR or --basetemp is set"""
+    if 'TMPDIR' in os.environ or not (os.path.isdir(TMPFS_DIR) and os.access(TMPFS_DIR, os.W_OK)):
+        return
+    # TemporaryDirectory(), tmp_path and the genomeQC.py subprocesses all follow TMPDIR
+    os.environ['TMPDIR'] = TMPFS_DIR
+    tempfile.tempdir = TMPFS_DIR
+
+
+@pytest.fixture(scope="session")
+def help_text():
+    """The --help text of genomeQC.py, formatted once for all help checks"""
+    return build_parser().format_help()
+
+
+@pytest.fixture(scope="module")
+def pipeline(tmp_path_factory):
+    """A GenomeQC pipeline for a tiny genome, shared by the tests of one module"""
+    tmp_dir = tmp_path_factory.mktemp('pipeline')
+    genome_file = tmp_dir / 'test.fasta'
+    genome_file.write_text(">test_sequence\nATCGATCGATCGATCG\n")
+    return GenomeQC(
+        genome_fasta=str(genome_file),
+        output_dir=str(tmp_dir / 'output'),
+        threads=2,
+        busco_dbs=['eukaryota_odb10']
+    )
+
+
+@pytest.fixture(scope="session")
+def run_genomeqc():
+    """
+    Run genomeQC.py with the given arguments and return a CompletedProcess.
+    
+    Only stderr, where genomeQC logs, is captured; stdout is discarded.
+    """
+    def run(argv, env=None):
+        return subprocess.run([sys.executable, str(REPO_DIR / 'genomeQC.py'), *map(str, argv)],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                              text=True, env=env)
+    return run
@@ -11,27 +11,151 @@ Comprehensive genomic quality assessment using multiple tools including:
 """
 
 import argparse
+import collections
+import contextlib
+import copy
+import functools
+import hashlib
+import itertools
 import os
 import sys
 import subprocess
+import textwrap
+import threading
+import time
 import logging
+import mmap
 import json
 import re
 import shlex
+import shutil
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
 from typing import List, Dict, Optional, Tuple
 from datetime import datetime
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
+# First column of each non-comment line of `micromamba env list`
+_ENV_RE = re.compile(r'^[ \t]*([^\s#]\S*)', re.M)
+# Leading module name (without /version) of each non-divider line of `modulecmd avail`
+_MODULE_RE = re.compile(r'^(?!-)[ \t]*(\S+?)(?:/\S+)?(?=\s|$)', re.M)
+
+
+@functools.lru_cache(maxsize=None)
+def _has(cmd: str) -> bool:
+    """Check whether an executable is on PATH without spawning it"""
+    return shutil.which(cmd) is not None
+
+
+@functools.lru_cache(maxsize=1)
+def _list_envs() -> Tuple[str, ...]:
+    """Names of existing micromamba environments, queried once per process"""
+    try:
+        result = subprocess.run(['micromamba', 'env', 'list'],
+                              capture_output=True, text=True, check=True)
+        return tuple(_ENV_RE.findall(result.stdout))
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return ()
+
+
+@functools.lru_cache(maxsize=1)
+def _list_modules() -> Tuple[str, ...]:
+    """Names of available environment modules, queried once per process"""
+    try:
+        result = subprocess.run(['modulecmd', 'python', 'avail'],
+                              capture_output=True, text=True)
+        # Module names are typically in format: name/version
+        return tuple(_MODULE_RE.findall(result.stdout + result.stderr))
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return ()
+
+
+def _available_memory() -> Optional[int]:
+    """
+    Memory in bytes that can be allocated without swapping, or None if unknown
+    
+    Uses MemAvailable from /proc/meminfo, which counts reclaimable page cache.
+    Elsewhere it falls back to sysconf's free pages, which undercount it.
+    """
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) << 10
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def _file_fingerprint(path: Path) -> str:
+    """Cheap content fingerprint of a file: its size plus the first and last MiB"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        digest.update(str(size).encode())
+        digest.update(f.read(1 << 20))
+        if size > 2 << 20:
+            f.seek(-(1 << 20), os.SEEK_END)
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _mkdirs_batch(root: Path, paths: List[Path]):
+    """
+    Create root and any of the given subdirectories of it that do not exist yet
+    
+    root is listed once, so subdirectories that already exist cost no
+    mkdir/stat round trip (noticeable on NFS/Lustre when rerunning). Only
+    root itself is scanned, never its parent, which the pipeline does not own.
+    """
+    root.mkdir(parents=True, exist_ok=True)
+    with os.scandir(root) as entries:
+        existing = {entry.name for entry in entries if entry.is_dir()}
+    
+    for path in paths:
+        if path.parent != root or path.name not in existing:
+            path.mkdir(parents=True, exist_ok=True)
+
 
 class PBSJobManager:
-    """Manage PBS/Torque job submission and script generation"""
+    """Manage PBS Pro job submission and script generation (Torque is not supported)"""
+    
+    # Whole job script, filled in a single format_map call per job
+    _PBS_SCRIPT_TMPL = textwrap.dedent("""\
+        #!/bin/bash
+        #PBS -N {job_name}
+        #PBS -q {queue}
+        #PBS -l nodes={nodes}:ppn={ppn}
+        #PBS -j oe
+        #PBS -l walltime={walltime}
+        {directives}
+        # Source bashrc for environment
+        source ~/.bashrc
+
+        # Navigate to working directory
+        cd {working_dir}
+        pwd
+        WD=`pwd`
+
+        # Setup logging
+        mkdir -p $WD/log
+        TIME=`date +%m%d_%H%M`
+        # Redirect stdout and stderr to log files with timestamps
+        exec > >(tee -a $WD/log/{log_name}_$TIME.log $WD/log/{log_name}_$TIME.out) \\
+             2> >(tee -a $WD/log/{log_name}_$TIME.err $WD/log/{log_name}_$TIME.out >&2)
+
+        {env_note}# Execute commands
+        echo 'Starting job execution...'
+        echo 'Job: {job_name}'
+        echo 'Date: '`date`
+
+        {commands}
+
+        echo 'Job completed at: '`date`""")
     
     def __init__(self, queue: str = 'high', nodes: int = 1, ppn: int = 60, 
                  walltime: str = '240:00:00', job_prefix: str = 'genomeQC'):
@@ -44,7 +168,10 @@ class PBSJobManager:
         
     def generate_pbs_script(self, job_name: str, commands: List[str], 
                            working_dir: str, env_name: Optional[str] = None,
-                           dependencies: Optional[List[str]] = None) -> str:
+                           dependencies: Optional[List[str]] = None,
+                           array_size: Optional[int] = None,
+                           ppn: Optional[int] = None,
+                           dependency_type: str = 'afterok') -> str:
         """
         Generate PBS job script content
         
@@ -54,77 +181,87 @@ class PBSJobManager:
             working_dir: Working directory for the job
             env_name: Optional conda/micromamba environment name
             dependencies: Optional list of job IDs this job depends on
+            array_size: Optional number of sub-jobs for a PBS array job
+            ppn: Optional processors per node for this job (defaults to self.ppn)
+            dependency_type: PBS dependency kind, e.g. afterok or afterany
             
         Returns:
             PBS script content as string
         """
-        script_lines = [
-            "#!/bin/bash",
-            f"#PBS -N {job_name}",
-            f"#PBS -q {self.queue}",
-            f"#PBS -l nodes={self.nodes}:ppn={self.ppn}",
-            f"#PBS -j oe",
-            f"#PBS -l walltime={self.walltime}"
-        ]
+        directives = ""
+        
+        # Array sub-jobs share the script, so keep their log files apart
+        log_name = job_name
+        if array_size:
+            directives += f"#PBS -J 0-{array_size - 1}\n"
+            log_name = f"{job_name}_${{PBS_ARRAY_INDEX}}"
         
         # Add job dependencies if specified
         if dependencies:
-            dep_string = ":".join(dependencies)
-            script_lines.append(f"#PBS -W depend=afterok:{dep_string}")
-        
-        # Add environment setup and logging
-        script_lines.extend([
-            "",
-            "# Source bashrc for environment",
-            "source ~/.bashrc",
-            "",
-            "# Navigate to working directory",
-            f"cd {working_dir}",
-            "pwd",
-            "WD=`pwd`",
-            "",
-            "# Setup logging",
-            "mkdir -p $WD/log",
-            "TIME=`date +%m%d_%H%M`",
-            "# Redirect stdout and stderr to log files with timestamps",
-            f'exec > >(tee -a $WD/log/{job_name}_$TIME.log $WD/log/{job_name}_$TIME.out) \\',
-            f'     2> >(tee -a $WD/log/{job_name}_$TIME.err $WD/log/{job_name}_$TIME.out >&2)',
-            ""
-        ])
+            directives += f"#PBS -W depend={dependency_type}:{':'.join(dependencies)}\n"
         
         # Note: Environment activation is handled via 'micromamba run -n' in commands
         # rather than using 'micromamba activate' which requires shell initialization
+        env_note = ""
         if env_name:
-            script_lines.extend([
-                f"# Note: Using 'micromamba run -n {env_name}' in commands below",
-                f"# instead of 'micromamba activate {env_name}' for better non-interactive execution",
-                ""
-            ])
-        
-        # Add actual commands
-        script_lines.extend([
-            "# Execute commands",
-            "echo 'Starting job execution...'",
-            "echo 'Job: {}'".format(job_name),
-            "echo 'Date: '`date`",
-            ""
-        ])
-        
-        script_lines.extend(commands)
+            env_note = (f"# Note: Using 'micromamba run -n {env_name}' in commands below\n"
+                        f"# instead of 'micromamba activate {env_name}' for better non-interactive execution\n"
+                        "\n")
+        
+        return self._PBS_SCRIPT_TMPL.format_map({
+            **vars(self),
+            'ppn': ppn or self.ppn,
+            'job_name': job_name,
+            'directives': directives,
+            'working_dir': working_dir,
+            'log_name': log_name,
+            'env_note': env_note,
+            'commands': "\n".join(commands)
+        })
+    
+    def generate_array_script(self, job_name: str, commands_per_index: List[List[str]],
+                              working_dir: str, env_name: Optional[str] = None,
+                              dependencies: Optional[List[str]] = None) -> str:
+        """
+        Generate a PBS array job script that dispatches on $PBS_ARRAY_INDEX
         
-        # Add completion message
-        script_lines.extend([
-            "",
-            "echo 'Job completed at: '`date`"
+        Args:
+            job_name: Name of the array job
+            commands_per_index: One list of commands per array index
+            working_dir: Working directory for the job
+            env_name: Optional conda/micromamba environment name
+            dependencies: Optional list of job IDs this job depends on
+            
+        Returns:
+            PBS script content as string
+        """
+        dispatch = ['case "$PBS_ARRAY_INDEX" in']
+        for index, commands in enumerate(commands_per_index):
+            dispatch.append(f"  {index})")
+            dispatch.extend(f"    {command}" for command in commands)
+            dispatch.append("    ;;")
+        dispatch.extend([
+            "  *)",
+            "    echo \"Unknown array index: $PBS_ARRAY_INDEX\"",
+            "    exit 1",
+            "    ;;",
+            "esac"
         ])
         
-        return "\n".join(script_lines)
+        return self.generate_pbs_script(job_name, dispatch, working_dir,
+                                        env_name=env_name,
+                                        dependencies=dependencies,
+                                        array_size=len(commands_per_index))
     
     def write_pbs_script(self, script_content: str, script_path: Path) -> Path:
         """Write PBS script to file"""
-        script_path.write_text(script_content)
-        script_path.chmod(0o755)  # Make executable
-        logger.info(f"PBS script written to: {script_path}")
+        # Create the file executable up front instead of a separate chmod by path
+        with os.fdopen(os.open(script_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o755), 'wb') as f:
+            # The umask may narrow the mode at creation, and a rewritten file keeps its old mode
+            os.fchmod(f.fileno(), 0o755)
+            # Encoded up front: one buffered write() of the whole script instead of going through a text layer
+            f.write(script_content.encode())
+        logger.info("PBS script written to: %s", script_path)
         return script_path
     
     def submit_job(self, script_path: Path, dry_run: bool = False) -> Optional[str]:
@@ -139,98 +276,207 @@ class PBSJobManager:
             Job ID if submitted, None if dry run or submission failed
         """
         if dry_run:
-            logger.info(f"[DRY RUN] Would submit job: qsub {script_path}")
+            logger.info("[DRY RUN] Would submit job: qsub %s", script_path)
             return None
         
         try:
             result = subprocess.run(['qsub', str(script_path)],
                                   capture_output=True, text=True, check=True)
             job_id = result.stdout.strip()
-            logger.info(f"Job submitted successfully: {job_id}")
+            logger.info("Job submitted successfully: %s", job_id)
             return job_id
         except subprocess.CalledProcessError as e:
-            logger.error(f"Failed to submit job: {e.stderr}")
+            logger.error("Failed to submit job: %s", e.stderr)
             return None
         except FileNotFoundError:
-            logger.error("qsub command not found. PBS/Torque may not be installed.")
+            logger.error("qsub command not found. PBS Pro may not be installed.")
             return None
+    
+    def submit_array(self, job_name: str, commands_per_index: List[List[str]],
+                     working_dir: str, script_dir: Path, env_name: Optional[str] = None,
+                     dependencies: Optional[List[str]] = None,
+                     dry_run: bool = False) -> Optional[str]:
+        """
+        Write and submit a single PBS array job covering all commands_per_index
+        
+        Returns:
+            Array job ID if submitted, None if dry run or submission failed
+        """
+        script_content = self.generate_array_script(job_name, commands_per_index,
+                                                    working_dir, env_name=env_name,
+                                                    dependencies=dependencies)
+        script_path = self.write_pbs_script(script_content, script_dir / f"{job_name}.pbs")
+        
+        job_id = self.submit_job(script_path, dry_run=dry_run)
+        if job_id:
+            self.submitted_jobs[job_name] = job_id
+        return job_id
+    
+    def submit_many(self, script_paths: List[Path], dry_run: bool = False,
+                    fanout: int = 8) -> List[Optional[str]]:
+        """
+        Submit several PBS scripts at once
+        
+        All scripts are handed to one `xargs ... qsub` process so only a single
+        subprocess is spawned from Python. Falls back to a thread pool of
+        `fanout` concurrent qsub calls when xargs is unavailable.
+        
+        Returns:
+            Job IDs in the same order as script_paths (None for failed or dry-run jobs)
+        """
+        if dry_run:
+            for script_path in script_paths:
+                logger.info("[DRY RUN] Would submit job: qsub %s", script_path)
+            return [None] * len(script_paths)
+        
+        if not script_paths:
+            return []
+        
+        # Each line of output is "<script path>\t<job id>"; an empty job id means qsub failed
+        listing = "\0".join(str(p) for p in script_paths) + "\0"
+        try:
+            result = subprocess.run(
+                ['xargs', '-0', '-n', '1', 'sh', '-c', 'printf "%s\\t%s\\n" "$0" "$(qsub "$0")"'],
+                input=listing, capture_output=True, text=True
+            )
+        except FileNotFoundError:
+            with ThreadPoolExecutor(max_workers=fanout) as executor:
+                return list(executor.map(self.submit_job, script_paths))
+        
+        submitted = {}
+        for line in result.stdout.splitlines():
+            path, _, job_id = line.partition("\t")
+            submitted[path] = job_id.strip() or None
+        
+        job_ids = []
+        for script_path in script_paths:
+            job_id = submitted.get(str(script_path))
+            if job_id:
+                logger.info("Job submitted successfully: %s", job_id)
+            else:
+                logger.error("Failed to submit job %s: %s", script_path, result.stderr.strip())
+            job_ids.append(job_id)
+        return job_ids
+
+    def poll_all(self) -> Dict[str, str]:
+        """
+        Query the state of every submitted job with a single qstat call
+
+        Returns:
+            Mapping of job name to PBS state letter (e.g. Q, R, F). Jobs missing
+            from an otherwise successful report are returned as 'F'; an empty
+            dict means qstat could not be queried or reported none of the jobs.
+        """
+        if not self.submitted_jobs:
+            return {}
+
+        try:
+            result = subprocess.run(['qstat', '-x', '-f', '-F', 'json', *self.submitted_jobs.values()],
+                                  capture_output=True, text=True)
+            jobs = json.loads(result.stdout).get('Jobs', {}) if result.stdout.strip() else {}
+        except FileNotFoundError:
+            logger.error("qstat command not found. PBS Pro may not be installed.")
+            return {}
+        except (json.JSONDecodeError, AttributeError):
+            logger.error("Could not parse qstat output: %s", result.stderr.strip())
+            return {}
+
+        # qstat also exits non-zero when only some IDs are unknown, so a failure is
+        # a report without any of our jobs, not just the exit status
+        if not jobs:
+            logger.warning("qstat reported none of the submitted jobs (exit status %s): %s",
+                           result.returncode, result.stderr.strip())
+            return {}
+
+        return {job_name: jobs.get(job_id, {}).get('job_state', 'F')
+                for job_name, job_id in self.submitted_jobs.items()}
+
+    def wait_all(self, interval: float = 15, backoff: float = 2.0,
+                 max_interval: float = 300) -> Dict[str, str]:
+        """
+        Block until all submitted jobs have finished
+
+        The delay between polls starts at `interval` seconds and grows by
+        `backoff` up to `max_interval`, to keep load on the PBS server low.
+        A failed poll is retried on the same schedule rather than taken as done.
+
+        Returns:
+            Final job states as returned by poll_all()
+        """
+        if not self.submitted_jobs:
+            return {}
+        while True:
+            states = self.poll_all()
+            pending = [name for name, state in states.items() if state not in ('F', 'C')]
+            if states and not pending:
+                return states
+            if states:
+                logger.info("Waiting for %d PBS job(s): %s", len(pending), ", ".join(pending))
+            else:
+                logger.warning("Could not query PBS job states; retrying in %.0f s", interval)
+            time.sleep(interval)
+            interval = min(interval * backoff, max_interval)
 
 
 class EnvironmentManager:
     """Manage software environments using micromamba, module, or direct installation"""
     
-    def __init__(self):
+    # Main executable of packages whose command differs from the package name
+    EXECUTABLES = {
+        'genometools': 'gt',
+        'ltr_retriever': 'LTR_retriever',
+        'ltr_finder': 'LTR_FINDER_parallel',
+        'merqury': 'merqury.sh',
+        'quast': 'quast.py'
+    }
+    
+    def __init__(self, prefer_system: bool = True):
+        # Use a tool already on PATH before looking for an environment or module
+        self.prefer_system = prefer_system
         self.micromamba_available = self._check_micromamba()
         self.module_available = self._check_module()
+        # Lowercased name -> actual name, filled on first lookup
+        self._envs = None
+        self._modules = None
         
     def _check_micromamba(self) -> bool:
         """Check if micromamba is available"""
-        try:
-            subprocess.run(['micromamba', '--version'], 
-                         capture_output=True, check=True)
-            return True
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            return False
+        return _has('micromamba')
     
     def _check_module(self) -> bool:
         """Check if environment modules are available"""
-        try:
-            result = subprocess.run(['modulecmd', 'python', 'list'],
-                                  capture_output=True, text=True)
-            return result.returncode == 0 or os.environ.get('MODULESHOME') is not None
-        except FileNotFoundError:
-            return False
+        return _has('modulecmd')
     
     def _get_existing_envs(self) -> List[str]:
         """Get list of existing micromamba environments"""
         if not self.micromamba_available:
             return []
-        try:
-            result = subprocess.run(['micromamba', 'env', 'list'],
-                                  capture_output=True, text=True, check=True)
-            envs = []
-            for line in result.stdout.split('\n'):
-                if line.strip() and not line.startswith('#'):
-                    parts = line.split()
-                    if parts:
-                        envs.append(parts[0])
-            return envs
-        except subprocess.CalledProcessError:
-            return []
+        return list(_list_envs())
     
     def _get_available_modules(self) -> List[str]:
         """Get list of available modules"""
         if not self.module_available:
             return []
-        try:
-            result = subprocess.run(['modulecmd', 'python', 'avail'],
-                                  capture_output=True, text=True)
-            modules = []
-            output = result.stdout + result.stderr
-            for line in output.split('\n'):
-                # Module names are typically in format: name/version
-                match = re.search(r'(\S+?)(?:/\S+)?(?:\s|$)', line)
-                if match and not line.startswith('-'):
-                    modules.append(match.group(1))
-            return modules
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            return []
+        return list(_list_modules())
     
-    def _env_exists(self, software_name: str, env_list: List[str]) -> Optional[str]:
+    def _env_exists(self, software_name: str) -> Optional[str]:
         """Check if environment exists (case-insensitive)"""
-        software_lower = software_name.lower()
-        for env in env_list:
-            if env.lower() == software_lower:
-                return env
-        return None
+        if self._envs is None:
+            self._envs = {env.lower(): env for env in self._get_existing_envs()}
+        return self._envs.get(software_name.lower())
     
-    def _module_exists(self, software_name: str, module_list: List[str]) -> Optional[str]:
+    def _module_exists(self, software_name: str) -> Optional[str]:
         """Check if module exists (case-insensitive)"""
-        software_lower = software_name.lower()
-        for module in module_list:
-            if module.lower() == software_lower:
-                return module
-        return None
+        if self._modules is None:
+            self._modules = {module.lower(): module for module in self._get_available_modules()}
+        return self._modules.get(software_name.lower())
+    
+    def invalidate_cache(self):
+        """Forget cached environment and module lists so they are queried again"""
+        _list_envs.cache_clear()
+        _list_modules.cache_clear()
+        self._envs = None
+        self._modules = None
     
     def setup_software(self, software_name: str, conda_package: Optional[str] = None,
                       channels: Optional[List[str]] = None) -> Dict[str, str]:
@@ -241,23 +487,28 @@ class EnvironmentManager:
         if not conda_package:
             conda_package = software_name
         
+        # A tool already on PATH (e.g. in a container image) needs no environment
+        # lookup, and each call then skips the `micromamba run` wrapper
+        if self.prefer_system and shutil.which(self.EXECUTABLES.get(software_name, software_name)):
+            logger.info("Using %s found on PATH", software_name)
+            return {'method': 'system', 'command': software_name}
+        
         # Check existing environments
-        existing_envs = self._get_existing_envs()
-        env_name = self._env_exists(software_name, existing_envs)
+        env_name = self._env_exists(software_name)
         if env_name:
-            logger.info(f"Using existing micromamba environment: {env_name}")
+            logger.info("Using existing micromamba environment: %s", env_name)
             return {'method': 'env', 'name': env_name}
         
         # Check available modules
-        available_modules = self._get_available_modules()
-        module_name = self._module_exists(software_name, available_modules)
+        module_name = self._module_exists(software_name)
         if module_name:
-            logger.info(f"Using module: {module_name}")
-            return {'method': 'module', 'name': module_name}
+            logger.info("Using module: %s", module_name)
+            return {'method': 'module', 'name': module_name,
+                    'prefix': f"module load {shlex.quote(module_name)} && "}
         
         # Create new environment with micromamba
         if self.micromamba_available:
-            logger.info(f"Creating new micromamba environment: {software_name}")
+            logger.info("Creating new micromamba environment: %s", software_name)
             try:
                 channel_args = []
                 if channels:
@@ -265,61 +516,207 @@ class EnvironmentManager:
                         channel_args.extend(['-c', channel])
                 
                 cmd = ['micromamba', 'create', '-n', software_name, '-y'] + channel_args + [conda_package]
-                result = subprocess.run(cmd, capture_output=True, text=True)
+                result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
                 
                 if result.returncode == 0:
-                    logger.info(f"Successfully created environment: {software_name}")
+                    logger.info("Successfully created environment: %s", software_name)
+                    self._envs[software_name.lower()] = software_name
+                    _list_envs.cache_clear()
                     return {'method': 'env', 'name': software_name}
                 else:
-                    logger.warning(f"Failed to create environment for {software_name}: {result.stderr}")
+                    logger.warning("Failed to create environment for %s: %s", software_name, result.stderr)
             except Exception as e:
-                logger.warning(f"Error creating environment for {software_name}: {e}")
+                logger.warning("Error creating environment for %s: %s", software_name, e)
         
         # Fallback to system
-        logger.info(f"Using system installation for {software_name}")
+        logger.info("Using system installation for %s", software_name)
         return {'method': 'system', 'command': software_name}
     
-    def run_command(self, env_info: Dict[str, str], command: List[str],
-                   cwd: Optional[str] = None, **kwargs) -> subprocess.CompletedProcess:
-        """Run command in the appropriate environment"""
+    def _full_command(self, env_info: Dict[str, str], command: List[str]) -> List[str]:
+        """Wrap command so it runs in the given environment"""
         if env_info['method'] == 'env':
-            full_cmd = ['micromamba', 'run', '-n', env_info['name']] + command
+            return ['micromamba', 'run', '-n', env_info['name']] + command
         elif env_info['method'] == 'module':
             # For module, we need to load it first - properly escape all command parts
-            escaped_cmd = ' '.join(shlex.quote(str(arg)) for arg in command)
-            module_cmd = f"module load {shlex.quote(env_info['name'])} && {escaped_cmd}"
-            full_cmd = ['bash', '-c', module_cmd]
+            prefix = env_info.get('prefix') or f"module load {shlex.quote(env_info['name'])} && "
+            return ['bash', '-c', prefix + shlex.join(map(str, command))]
         else:
-            full_cmd = command
+            return command
+    
+    def run_command(self, env_info: Dict[str, str], command: List[str],
+                   cwd: Optional[str] = None, **kwargs) -> subprocess.CompletedProcess:
+        """Run command in the appropriate environment"""
+        return subprocess.run(self._full_command(env_info, command), cwd=cwd, **kwargs)
+    
+    def run_command_streamed(self, env_info: Dict[str, str], command: List[str], log_path: Path,
+                             cwd: Optional[str] = None, tail: int = 200) -> subprocess.CompletedProcess:
+        """
+        Run command in the appropriate environment, streaming its output to a log file
         
-        return subprocess.run(full_cmd, cwd=cwd, **kwargs)
+        stdout and stderr are written to log_path as they are produced; only the
+        last `tail` lines are kept in memory and returned as the result's stderr.
+        """
+        full_cmd = self._full_command(env_info, command)
+        last_lines = collections.deque(maxlen=tail)
+        
+        with open(log_path, 'wb', buffering=0) as log, \
+                subprocess.Popen(full_cmd, cwd=cwd, stdout=subprocess.PIPE,
+                                 stderr=subprocess.STDOUT) as proc:
+            for line in proc.stdout:
+                log.write(line)
+                last_lines.append(line)
+        
+        return subprocess.CompletedProcess(full_cmd, proc.returncode, stdout=None,
+                                           stderr=b"".join(last_lines).decode(errors='replace'))
 
 
 class GenomeQC:
     """Main genome QC pipeline"""
     
+    # BUSCO command line for cluster jobs
+    BUSCO_CMD_TMPL = "micromamba run -n busco busco -i {genome} -o {out} -m genome -c {threads} -l {lineage}{extra}"
+    
+    # QUAST command line for cluster jobs
+    QUAST_CMD_TMPL = ("micromamba run -n quast quast.py {genome} -o {out} -t {threads} "
+                      "--min-contig 0 --plots-format png --large{extra}")
+    
+    # Analyses in pipeline order: stage -> (method, prerequisite stages, relative thread weight).
+    # They only share the input genome, so none currently waits for another.
+    STAGE_GRAPH = {
+        'telomere_gap': ('run_telomere_gap_analysis', (), 1),
+        'busco': ('run_busco', (), 4),
+        'merqury': ('run_merqury', (), 2),
+        'coverage': ('run_coverage_analysis', (), 3),
+        'ltr_analysis': ('run_ltr_analysis', (), 3),
+        'quast': ('run_quast', (), 1),
+        'synteny': ('run_synteny_analysis', (), 2)
+    }
+    
+    # (results key, heading) of each section of the text summary, in report order
+    SUMMARY_SECTIONS = [
+        ('telomere_gap', "TELOMERE AND GAP ANALYSIS"),
+        ('busco', "BUSCO COMPLETENESS ASSESSMENT"),
+        ('merqury', "MERQURY QV CALCULATION"),
+        ('ltr_analysis', "LTR ANALYSIS AND LAI"),
+        ('quast', "QUAST ASSEMBLY STATISTICS"),
+        ('synteny', "SYNTENY ANALYSIS"),
+        ('coverage', "COVERAGE ANALYSIS (MOSDEPTH)")
+    ]
+    
+    # Report files concatenated by the cluster SUMMARY job, relative to the output directory
+    CLUSTER_SUMMARY_FILES = [
+        'telomere_gap/seqkit_stats.tsv',
+        'busco/busco_*/short_summary*.txt',
+        'merqury/*.qv',
+        'coverage/*.mosdepth.summary.txt',
+        'ltr_analysis/*.LAI',
+        'quast/report.txt'
+    ]
+    
+    # Software environments each direct-mode stage sets up, resolved together before the run
+    STAGE_ENVS = {
+        'telomere_gap': ['seqkit'],
+        'busco': ['busco'],
+        'merqury': ['merqury'],
+        'coverage': ['minimap2', 'samtools', 'mosdepth'],
+        'ltr_analysis': ['genometools', 'ltr_retriever', 'ltr_finder'],
+        'quast': ['quast']
+    }
+    
+    # Attributes, besides the genome, whose values decide whether a cached stage can be reused
+    STAGE_CACHE_INPUTS = {
+        'telomere_gap': ('organism_type', 'min_telomere_length'),
+        'busco': ('busco_dbs',),
+        'merqury': ('reads',),
+        'coverage': ('reads',),
+        'ltr_analysis': (),
+        'quast': ('reference_genome',),
+        'synteny': ('reference_genome',)
+    }
+    
+    # Downloads, indexes and intermediates left out of stage cache entries
+    # (shutil.ignore_patterns globs); only reports and the results are stored
+    STAGE_CACHE_EXCLUDE = {
+        'busco': ('busco_downloads', 'hmmer_output', 'metaeuk_output', 'miniprot_output',
+                  'augustus_output', 'blast_output', 'busco_sequences'),
+        'merqury': ('*.meryl',),
+        'coverage': ('*.sam', '*.bam', '*.bai'),
+        # gt suffixerator index files
+        'ltr_analysis': ('*.esq', '*.des', '*.ssp', '*.sds', '*.lcp', '*.llv', '*.suf',
+                         '*.tis', '*.ois', '*.md5', '*.prj')
+    }
+    
+    # Workflow file written by plan() for each supported engine
+    WORKFLOW_FILES = {
+        'snakemake': 'Snakefile',
+        'makeflow': 'genomeQC.makeflow',
+        'nextflow': 'main.nf'
+    }
+    
+    # Rough peak memory of one BUSCO run, used to cap how many run side by side;
+    # override with the GENOMEQC_BUSCO_MEM_GB environment variable
+    BUSCO_JOB_MEM_GB = 8
+    
+    # Tools run straight from PATH (or as a system fallback), located once at startup
+    PROBED_TOOLS = ['quartet.py', 'quartet', 'GenomeSyn', 'LTR_FINDER_parallel', 'LAI']
+    
+    # seqkit fallback: all stats plus N counts (sum_gap column) from a single pass over the FASTA
+    SEQKIT_STATS_ARGS = ['seqkit', 'stats', '-a', '-T', '-G', 'N']
+    
     def __init__(self, genome_fasta: str, output_dir: str, threads: int,
                  busco_dbs: List[str], reference_genome: Optional[str] = None,
                  organism_type: str = 'plant', min_telomere_length: int = 50,
                  cluster_mode: bool = False, pbs_queue: str = 'high',
                  pbs_nodes: int = 1, pbs_ppn: int = 60, 
                  pbs_walltime: str = '240:00:00', dry_run: bool = False,
-                 reads: Optional[List[str]] = None):
-        self.genome_fasta = Path(genome_fasta).resolve()
-        self.output_dir = Path(output_dir).resolve()
+                 reads: Optional[List[str]] = None, max_parallel: Optional[int] = None,
+                 verify_tools: bool = False, cache_dir: Optional[str] = None,
+                 prefer_system: bool = True, resume: bool = False):
+        # absolute() only prepends the cwd; resolve() would readlink every path component
+        self.genome_fasta = Path(genome_fasta).absolute()
+        self.output_dir = Path(output_dir).absolute()
         self.threads = threads
+        self.max_parallel = max_parallel
+        self.verify_tools = verify_tools
+        # Completed direct-mode stages are stored here and reused when their inputs match
+        self.cache_dir = Path(cache_dir).absolute() if cache_dir else None
+        # Skip stages that succeeded in the run recorded in .state.json
+        self.resume = resume
+        self._state_file = self.output_dir / ".state.json"
+        # Whole-genome digest, computed on first use by genome_fingerprint()
+        self._genome_hash = None
+        self._genome_hash_lock = threading.Lock()
         self.busco_dbs = busco_dbs
-        self.reference_genome = Path(reference_genome).resolve() if reference_genome else None
+        self.reference_genome = Path(reference_genome).absolute() if reference_genome else None
         self.organism_type = organism_type
         self.min_telomere_length = min_telomere_length
-        self.reads = [Path(r).resolve() for r in reads] if reads else None
+        self.reads = [Path(r).absolute() for r in reads] if reads else None
         
         # Cluster mode settings
         self.cluster_mode = cluster_mode
         self.dry_run = dry_run
         
-        self.env_manager = EnvironmentManager()
+        self.env_manager = EnvironmentManager(prefer_system=prefer_system)
+        # Stage name -> result dict; stages run on worker threads, so every read and
+        # write goes through _results_lock and a stage's result is assigned whole
         self.results = {}
+        self._results_lock = threading.Lock()
+        
+        # (software, channels) -> env info from setup_software, persisted across runs
+        self._env_cache_file = self.output_dir / ".env_cache.json"
+        self._env_cache = None
+        self._env_lock = threading.Lock()
+        self._env_key_locks = {}
+        
+        # Per-thread share of self.threads while analyses run concurrently
+        self._stage_local = threading.local()
+        # Stage pool shared for the object's lifetime when used as a context manager
+        self._executor = None
+        # Jobs recorded by plan() instead of being submitted, None otherwise
+        self._planned_jobs = None
+        
+        # Tool name -> path on PATH or None, so stages do not probe mid-run
+        self._tools = self._probe_tools(self.PROBED_TOOLS)
         
         # Initialize PBS job manager if in cluster mode
         if cluster_mode:
@@ -331,9 +728,7 @@ class GenomeQC:
                 job_prefix='genomeQC'
             )
             self.job_dependencies = {}  # Track job dependencies
-        
-        # Create output directory
-        self.output_dir.mkdir(parents=True, exist_ok=True)
+            self._pending_jobs = []  # Independent jobs awaiting batched submission
         
         # Setup subdirectories
         self.telomere_dir = self.output_dir / "telomere_gap"
@@ -343,42 +738,362 @@ class GenomeQC:
         self.quast_dir = self.output_dir / "quast"
         self.synteny_dir = self.output_dir / "synteny"
         self.coverage_dir = self.output_dir / "coverage"
+        self.pbs_dir = self.output_dir / "pbs_scripts"
+        
+        # File name of the genome with and without extension, used to name outputs
+        self.genome_name = self.genome_fasta.name
+        self.genome_stem = self.genome_fasta.stem
+        
+        # String forms of paths that are embedded in many commands
+        self._genome_fasta_s = str(self.genome_fasta)
+        self._telomere_dir_s = str(self.telomere_dir)
+        self._busco_dir_s = str(self.busco_dir)
+        self._ltr_dir_s = str(self.ltr_dir)
         
-        for d in [self.telomere_dir, self.busco_dir, self.merqury_dir,
-                  self.ltr_dir, self.quast_dir, self.synteny_dir, self.coverage_dir]:
-            d.mkdir(exist_ok=True)
+        # Create output directory and subdirectories
+        directories = [self.telomere_dir, self.busco_dir, self.merqury_dir,
+                       self.ltr_dir, self.quast_dir, self.synteny_dir, self.coverage_dir]
+        if cluster_mode:
+            directories.append(self.pbs_dir)
+        _mkdirs_batch(self.output_dir, directories)
     
-    def check_quartet_available(self) -> bool:
-        """Check if quartet is available in the system"""
+    def _load_env_cache(self) -> Dict[str, Dict[str, str]]:
+        """Read .env_cache.json, dropping environments and modules that no longer exist"""
         try:
-            # Try quartet.py first (the actual command we use)
-            result = subprocess.run(['quartet.py', '--help'], 
-                                  capture_output=True)
-            if result.returncode == 0:
-                return True
-        except FileNotFoundError:
-            pass
+            saved = json.loads(self._env_cache_file.read_text())
+        except (OSError, ValueError):
+            return {}
+        # Whether a tool on PATH wins depends on prefer_system, so a file written
+        # with the other setting (or an older format) is not used
+        if not isinstance(saved, dict) or saved.get('prefer_system') != self.env_manager.prefer_system:
+            return {}
+        exists = {'env': self.env_manager._env_exists, 'module': self.env_manager._module_exists}
+        cache = {}
+        for key, env_info in saved.get('envs', {}).items():
+            check = exists.get(env_info.get('method'))
+            if check and check(env_info.get('name', '')):
+                cache[key] = env_info
+            else:
+                logger.info("Cached environment %s no longer exists, setting it up again", key)
+        return cache
+    
+    def _env(self, software_name: str, channels: Optional[List[str]] = None) -> Dict[str, str]:
+        """
+        Set up a software environment once per output directory
+        
+        Results of EnvironmentManager.setup_software are reused by every stage,
+        and environments and modules found are kept in .env_cache.json so
+        reruns skip the lookup and any micromamba solve. Entries whose environment
+        or module has since been removed are set up again. Delete the file to
+        detect all environments again.
+        """
+        key = f"{software_name}|{','.join(sorted(channels or []))}"
+        with self._env_lock:
+            if self._env_cache is None:
+                self._env_cache = self._load_env_cache()
+            key_lock = self._env_key_locks.setdefault(key, threading.Lock())
+        
+        # Different software can be set up concurrently; the same software only once
+        with key_lock:
+            env_info = self._env_cache.get(key)
+            if env_info is None:
+                env_info = self.env_manager.setup_software(software_name, channels=channels)
+                with self._env_lock:
+                    self._env_cache[key] = env_info
+                    # A system fallback may be a failed create, so only real environments are persisted
+                    if env_info['method'] != 'system':
+                        with open(self._env_cache_file, 'w') as f:
+                            json.dump({
+                                'prefer_system': self.env_manager.prefer_system,
+                                'envs': {k: v for k, v in self._env_cache.items() if v['method'] != 'system'}
+                            }, f, indent=2)
+            else:
+                logger.info("Using cached environment for %s: %s", software_name,
+                           env_info.get('name') or env_info.get('command'))
+        return env_info
+    
+    def __enter__(self):
+        self._executor = ThreadPoolExecutor(max_workers=max(1, self.max_parallel or self.threads))
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def close(self):
+        """Shut down the shared stage pool, waiting for running stages"""
+        if self._executor:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+    
+    def _stage_threads(self) -> int:
+        """Number of threads the calling analysis may use"""
+        return getattr(self._stage_local, 'threads', self.threads)
+    
+    def _prewarm_envs(self, completed: Tuple[str, ...] = (), max_workers: int = 4):
+        """
+        Resolve the environments of all stages that will run, several at a time
         
+        Any micromamba creates then overlap instead of each stage waiting on
+        its own when it starts; the stages find the results through _env.
+        Stages listed in `completed` are left out.
+        """
+        skip = set(completed)
+        if not self.reads:
+            skip.update(['merqury', 'coverage'])
+        if self.check_quartet_available():
+            skip.add('telomere_gap')
+        software = [name for stage, names in self.STAGE_ENVS.items() if stage not in skip
+                    for name in names]
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(lambda name: self._env(name, channels=['bioconda', 'conda-forge']),
+                              software))
+    
+    def _set_result(self, stage: str, result: Dict):
+        """Record the complete result of a stage"""
+        with self._results_lock:
+            self.results[stage] = result
+    
+    def _get_result(self, stage: str) -> Dict:
+        """Result of a stage, or an empty dict if it has none yet"""
+        with self._results_lock:
+            return self.results.get(stage, {})
+    
+    def _results_snapshot(self) -> Dict:
+        """Deep copy of all results, safe to serialise while stages are running"""
+        with self._results_lock:
+            return copy.deepcopy(self.results)
+    
+    def _checkpoint(self):
+        """Atomically write the results so far to .state.json"""
+        tmp = self._state_file.with_name(f"{self._state_file.name}.tmp")
+        results = self._results_snapshot()
+        with open(tmp, 'w') as f:
+            json.dump(results, f, check_circular=False, default=str)
+        os.replace(tmp, self._state_file)
+    
+    def _load_checkpoint(self) -> List[str]:
+        """
+        Restore the results of stages that succeeded in the checkpointed run
+        
+        Returns:
+            Names of the restored stages
+        """
         try:
-            # Fallback to checking for 'quartet' command
-            result = subprocess.run(['quartet', '--help'], 
-                                  capture_output=True)
-            return result.returncode == 0
-        except FileNotFoundError:
-            return False
+            state = json.loads(self._state_file.read_text())
+        except (OSError, ValueError):
+            return []
+        
+        restored = [stage for stage in self.STAGE_GRAPH
+                    if self._stage_succeeded(state.get(stage, {}))]
+        for stage in restored:
+            self._set_result(stage, state[stage])
+        if restored:
+            logger.info("Resuming: skipping completed stages %s", ", ".join(restored))
+        return restored
+    
+    def _run_stage_graph(self, completed: Tuple[str, ...] = ()):
+        """
+        Run the direct-mode analyses as a dependency graph on a thread pool
+        
+        A stage starts once all of its prerequisites have finished. At most
+        max_parallel stages (default: one per thread) run at once, and stages
+        started together split the free threads in proportion to their
+        STAGE_GRAPH weight. Each stage sees its share through _stage_threads().
+        Stages listed in `completed` are not run again, and the results are
+        checkpointed after every stage that finishes. If a stage raises, its
+        error is recorded as the stage result and no further stages are started;
+        the running ones are allowed to finish before the first error is re-raised.
+        """
+        graph = self.STAGE_GRAPH
+        workers = max(1, min(len(graph), self.max_parallel or self.threads))
+        done = set(completed)
+        pending = [name for name in graph if name not in done]
+        running = {}  # future -> (stage name, threads)
+        free_threads = self.threads
+        errors = []
+        
+        def run_stage(name, method, threads):
+            self._stage_local.threads = threads
+            try:
+                if self.cache_dir:
+                    self._run_stage_cached(name, method)
+                else:
+                    getattr(self, method)()
+            finally:
+                del self._stage_local.threads
+        
+        # Outside a `with GenomeQC(...)` block, use a pool just for this run
+        if self._executor:
+            pool = contextlib.nullcontext(self._executor)
+        else:
+            pool = ThreadPoolExecutor(max_workers=workers)
+        with pool as executor:
+            while (pending and not errors) or running:
+                ready = [] if errors else [name for name in pending if done.issuperset(graph[name][1])]
+                batch = ready[:workers - len(running)]
+                batch_weight = sum(graph[name][2] for name in batch)
+                
+                for name in batch:
+                    method, _, weight = graph[name]
+                    threads = max(1, max(free_threads, 0) * weight // batch_weight)
+                    batch_weight -= weight
+                    free_threads -= threads
+                    pending.remove(name)
+                    running[executor.submit(run_stage, name, method, threads)] = (name, threads)
+                
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name, threads = running.pop(future)
+                    free_threads += threads
+                    error = future.exception()
+                    if error is not None:
+                        logger.error("Stage %s failed: %s", name, error)
+                        self._set_result(name, {'status': 'error', 'error': str(error)})
+                        errors.append(error)
+                    else:
+                        done.add(name)
+                    self._checkpoint()
+        
+        if errors:
+            raise errors[0]
+    
+    def genome_fingerprint(self) -> str:
+        """
+        blake2b digest of the whole genome FASTA
+        
+        The file is memory-mapped and hashed in one update() call, once per
+        pipeline; every stage cache key shares the result.
+        """
+        with self._genome_hash_lock:
+            if self._genome_hash is None:
+                digest = hashlib.blake2b(digest_size=16)
+                with open(self.genome_fasta, 'rb') as f:
+                    # mmap cannot map an empty file
+                    if os.fstat(f.fileno()).st_size:
+                        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                            digest.update(mm)
+                self._genome_hash = digest.hexdigest()
+            return self._genome_hash
+    
+    def _cache_token(self, value):
+        """JSON-able stand-in for an input value, fingerprinting the files it names"""
+        if isinstance(value, list):
+            return [self._cache_token(item) for item in value]
+        if isinstance(value, (str, Path)) and os.path.exists(value):
+            path = Path(value)
+            if path.is_file():
+                return _file_fingerprint(path)
+            # Local BUSCO lineage directories change as a whole, so go by mtime
+            return [str(path.absolute()), path.stat().st_mtime_ns]
+        return str(value) if isinstance(value, Path) else value
+    
+    def _stage_cache_key(self, stage: str) -> str:
+        """Hash of everything a stage's output depends on"""
+        inputs = {
+            'stage': stage,
+            'genome': self.genome_fingerprint(),
+            # Installing an optional tool (e.g. LAI) changes what a stage produces
+            'tools': sorted(tool for tool, path in self._tools.items() if path),
+            **{attr: self._cache_token(getattr(self, attr))
+               for attr in self.STAGE_CACHE_INPUTS[stage]}
+        }
+        return hashlib.blake2b(json.dumps(inputs, sort_keys=True).encode(),
+                               digest_size=16).hexdigest()
+    
+    @staticmethod
+    def _stage_succeeded(result: Dict) -> bool:
+        """Whether a stage result (or every per-database BUSCO result) succeeded"""
+        results = [result] if 'status' in result else list(result.values())
+        return bool(results) and all(isinstance(r, dict) and r.get('status') in ('success', 'completed')
+                                     for r in results)
+    
+    def _run_stage_cached(self, stage: str, method: str):
+        """
+        Restore a stage from cache_dir when its inputs are unchanged, else run it
+        
+        Each entry is a directory named by _stage_cache_key holding the stage's
+        results and a copy of its output directory without the files matched by
+        STAGE_CACHE_EXCLUDE. Only successful stages are stored.
+        """
+        stage_dir = self.output_dir / stage
+        entry = self.cache_dir / self._stage_cache_key(stage)
+        # Results embed the output path; store it as a placeholder so entries work for any -o
+        stage_dir_json = json.dumps(str(stage_dir))[1:-1]
+        
+        try:
+            cached = (entry / 'result.json').read_text()
+        except OSError:
+            cached = None
+        if cached is not None:
+            shutil.copytree(entry / 'output', stage_dir, dirs_exist_ok=True)
+            self._set_result(stage, json.loads(cached.replace('@STAGE_DIR@', stage_dir_json)))
+            logger.info("%s restored from cache entry %s", stage, entry.name)
+            return
+        
+        getattr(self, method)()
+        
+        result = self._get_result(stage)
+        if not self._stage_succeeded(result):
+            return
+        # Fill a temporary directory and rename it into place, so a partial entry is never seen
+        tmp = entry.with_name(f"{entry.name}.tmp-{os.getpid()}-{threading.get_ident()}")
+        try:
+            shutil.copytree(stage_dir, tmp / 'output',
+                            ignore=shutil.ignore_patterns(*self.STAGE_CACHE_EXCLUDE.get(stage, ())))
+            (tmp / 'result.json').write_text(
+                json.dumps(result).replace(stage_dir_json, '@STAGE_DIR@'))
+            os.replace(tmp, entry)
+            logger.info("%s stored in cache entry %s", stage, entry.name)
+        except OSError as e:
+            logger.warning("Could not cache %s results: %s", stage, e)
+            shutil.rmtree(tmp, ignore_errors=True)
+    
+    @staticmethod
+    def _probe_tools(tools: List[str]) -> Dict[str, Optional[str]]:
+        """Locate each tool on PATH once and report the missing ones up front"""
+        found = {tool: shutil.which(tool) for tool in tools}
+        missing = [tool for tool, path in found.items() if path is None]
+        if missing:
+            logger.info("Not found on PATH (dependent steps will be skipped or use fallbacks): %s",
+                        ', '.join(missing))
+        return found
+    
+    def _tool_available(self, *commands: str) -> bool:
+        """
+        Check whether any of the given commands is on PATH
+        
+        With verify_tools set, the first command found is also run with --help
+        to make sure it actually starts (slow for tools with heavy imports).
+        """
+        for cmd in commands:
+            found = self._tools[cmd] if cmd in self._tools else _has(cmd)
+            if found:
+                if not self.verify_tools:
+                    return True
+                try:
+                    result = subprocess.run([cmd, '--help'], stdout=subprocess.DEVNULL,
+                                          stderr=subprocess.DEVNULL, timeout=60)
+                    return result.returncode == 0
+                except (OSError, subprocess.TimeoutExpired):
+                    return False
+        return False
+    
+    def check_quartet_available(self) -> bool:
+        """Check if quartet is available in the system"""
+        # quartet.py is the actual command we use; 'quartet' is accepted as well
+        return self._tool_available('quartet.py', 'quartet')
     
     def check_genomesyn_available(self) -> bool:
         """Check if GenomeSyn is available in the system"""
-        try:
-            result = subprocess.run(['GenomeSyn', '--help'],
-                                  capture_output=True)
-            return result.returncode == 0
-        except FileNotFoundError:
-            return False
+        return self._tool_available('GenomeSyn')
     
     def _create_and_submit_job(self, job_name: str, commands: List[str],
                                working_dir: Path, env_name: Optional[str] = None,
-                               dependencies: Optional[List[str]] = None) -> Optional[str]:
+                               dependencies: Optional[List[str]] = None,
+                               defer_as: Optional[str] = None,
+                               ppn: Optional[int] = None,
+                               dependency_type: str = 'afterok') -> Optional[str]:
         """
         Create PBS script and submit job (or save script in dry run mode)
         
@@ -388,6 +1103,10 @@ class GenomeQC:
             working_dir: Working directory for the job
             env_name: Optional environment name
             dependencies: Optional list of job IDs this job depends on
+            defer_as: If given, queue the job for batched submission instead of
+                      submitting now; its ID is recorded under this dependency key
+            ppn: Optional processors per node override for this job
+            dependency_type: PBS dependency kind for dependencies (default: afterok)
             
         Returns:
             Job ID if submitted, None otherwise
@@ -395,9 +1114,14 @@ class GenomeQC:
         if not self.cluster_mode:
             return None
         
-        # Create PBS scripts directory
-        pbs_dir = self.output_dir / "pbs_scripts"
-        pbs_dir.mkdir(exist_ok=True)
+        # While planning a workflow, record the job under its name instead of writing PBS files
+        if self._planned_jobs is not None:
+            self._planned_jobs.append((job_name, commands, working_dir, list(dependencies or []),
+                                       ppn or self.threads))
+            self.pbs_manager.submitted_jobs[job_name] = job_name
+            if defer_as:
+                self.job_dependencies[defer_as] = job_name
+            return job_name
         
         # Generate script content
         script_content = self.pbs_manager.generate_pbs_script(
@@ -405,13 +1129,19 @@ class GenomeQC:
             commands=commands,
             working_dir=str(working_dir),
             env_name=env_name,
-            dependencies=dependencies
+            dependencies=dependencies,
+            ppn=ppn,
+            dependency_type=dependency_type
         )
         
         # Write script to file
-        script_path = pbs_dir / f"{job_name}.pbs"
+        script_path = self.pbs_dir / f"{job_name}.pbs"
         self.pbs_manager.write_pbs_script(script_content, script_path)
         
+        if defer_as:
+            self._pending_jobs.append((job_name, script_path, defer_as))
+            return None
+        
         # Submit job (or log in dry run mode)
         job_id = self.pbs_manager.submit_job(script_path, dry_run=self.dry_run)
         
@@ -420,6 +1150,67 @@ class GenomeQC:
             
         return job_id
     
+    def _create_and_submit_array_job(self, job_name: str, commands_per_index: List[List[str]],
+                                     working_dir: Path, env_name: Optional[str] = None,
+                                     dependencies: Optional[List[str]] = None) -> Optional[str]:
+        """Create and submit a PBS array job with one sub-job per command list"""
+        if not self.cluster_mode:
+            return None
+        
+        # Workflow engines have no array jobs; plan one job per index instead
+        if self._planned_jobs is not None:
+            for index, commands in enumerate(commands_per_index, 1):
+                self._create_and_submit_job(f"{job_name}_{index}", commands, working_dir,
+                                            dependencies=dependencies)
+            return None
+        
+        return self.pbs_manager.submit_array(
+            job_name=job_name,
+            commands_per_index=commands_per_index,
+            working_dir=str(working_dir),
+            script_dir=self.pbs_dir,
+            env_name=env_name,
+            dependencies=dependencies,
+            dry_run=self.dry_run
+        )
+    
+    def _submit_pending_jobs(self):
+        """Submit all queued independent jobs in one batch"""
+        if not self._pending_jobs:
+            return
+        
+        pending, self._pending_jobs = self._pending_jobs, []
+        job_ids = self.pbs_manager.submit_many([script_path for _, script_path, _ in pending],
+                                               dry_run=self.dry_run)
+        
+        for (job_name, _, dependency_key), job_id in zip(pending, job_ids):
+            if job_id:
+                self.pbs_manager.submitted_jobs[job_name] = job_id
+                self.job_dependencies[dependency_key] = job_id
+    
+    def _submit_summary_job(self):
+        """
+        Submit a job that gathers the main report files once all other jobs have ended
+        
+        It uses afterany so a report is still written when some analyses failed.
+        """
+        commands = [
+            f"for f in {' '.join(self.CLUSTER_SUMMARY_FILES)}; do",
+            '  if [ -f "$f" ]; then echo "== $f"; cat "$f"; echo; fi',
+            "done > summary_report.txt"
+        ]
+        
+        job_id = self._create_and_submit_job(
+            job_name="SUMMARY",
+            commands=commands,
+            working_dir=self.output_dir,
+            dependencies=list(self.pbs_manager.submitted_jobs.values()),
+            ppn=1,
+            dependency_type='afterany'
+        )
+        
+        logger.info("SUMMARY job created: %s", job_id or 'dry-run')
+    
     def run_telomere_gap_analysis(self):
         """Run telomere and gap analysis using quartet or seqkit"""
         logger.info("=" * 60)
@@ -428,28 +1219,24 @@ class GenomeQC:
         
         if self.cluster_mode:
             # Generate PBS job for telomere/gap analysis
-            genome_prefix = self.genome_fasta.stem
-            
             if self.check_quartet_available():
                 commands = [
-                    f"quartet.py TeloExplorer -i {self.genome_fasta} -c {self.organism_type} -m {self.min_telomere_length} -p {genome_prefix}"
+                    f"quartet.py TeloExplorer -i {self._genome_fasta_s} -c {self.organism_type} -m {self.min_telomere_length} -p {self.genome_stem}"
                 ]
             else:
+                seqkit_cmd = shlex.join(self.SEQKIT_STATS_ARGS + [self._genome_fasta_s])
                 commands = [
-                    f"micromamba run -n seqkit seqkit stats -a -T {self.genome_fasta} > seqkit_stats.tsv",
-                    f"micromamba run -n seqkit seqkit fx2tab -n -g {self.genome_fasta} > gap_content.tsv"
+                    f"micromamba run -n seqkit {seqkit_cmd} > seqkit_stats.tsv"
                 ]
             
-            job_id = self._create_and_submit_job(
+            self._create_and_submit_job(
                 job_name="TELOMERE_GAP",
                 commands=commands,
-                working_dir=self.telomere_dir
+                working_dir=self.telomere_dir,
+                defer_as='telomere_gap'
             )
             
-            if job_id:
-                self.job_dependencies['telomere_gap'] = job_id
-                
-            logger.info(f"Telomere/gap analysis job created: {job_id or 'dry-run'}")
+            logger.info("Telomere/gap analysis job queued for submission")
             return
         
         # Original direct execution mode
@@ -463,92 +1250,146 @@ class GenomeQC:
     def _run_quartet(self):
         """Run quartet for telomere and gap analysis with visualization"""
         try:
-            # Get genome file name without extension for prefix
-            genome_prefix = self.genome_fasta.stem
-            
             # quartet TeloExplorer with proper parameters
             # Command format: quartet.py TeloExplorer -i input.fa -c organism_type -m min_length -p prefix
             cmd = ['quartet.py', 'TeloExplorer',
-                   '-i', str(self.genome_fasta),
+                   '-i', self._genome_fasta_s,
                    '-c', self.organism_type,
                    '-m', str(self.min_telomere_length),
-                   '-p', genome_prefix]
+                   '-p', self.genome_stem]
             
-            result = subprocess.run(cmd, cwd=str(self.telomere_dir),
-                                  capture_output=True, text=True)
+            log_dir = self.telomere_dir / 'log'
+            log_dir.mkdir(exist_ok=True)
+            result = self.env_manager.run_command_streamed({'method': 'system'}, cmd,
+                                                           log_dir / 'quartet.log',
+                                                           cwd=self._telomere_dir_s)
             
             if result.returncode == 0:
                 logger.info("quartet TeloExplorer analysis completed successfully")
-                logger.info(f"Output prefix: {genome_prefix}")
-                self.results['telomere_gap'] = {
+                logger.info("Output prefix: %s", self.genome_stem)
+                self._set_result('telomere_gap', {
                     'tool': 'quartet',
                     'status': 'success',
-                    'output_dir': str(self.telomere_dir),
-                    'prefix': genome_prefix,
+                    'output_dir': self._telomere_dir_s,
+                    'prefix': self.genome_stem,
                     'organism_type': self.organism_type,
                     'min_length': self.min_telomere_length
-                }
+                })
             else:
-                logger.error(f"quartet failed: {result.stderr}")
-                self.results['telomere_gap'] = {
+                logger.error("quartet failed: %s", result.stderr)
+                self._set_result('telomere_gap', {
                     'tool': 'quartet',
                     'status': 'failed',
                     'error': result.stderr
-                }
+                })
         except Exception as e:
-            logger.error(f"Error running quartet: {e}")
-            self.results['telomere_gap'] = {
+            logger.error("Error running quartet: %s", e)
+            self._set_result('telomere_gap', {
                 'tool': 'quartet',
                 'status': 'error',
                 'error': str(e)
-            }
+            })
     
     def _run_seqkit(self):
         """Run seqkit for basic statistics (fallback when quartet unavailable)"""
-        seqkit_env = self.env_manager.setup_software('seqkit', 
-                                                      channels=['bioconda', 'conda-forge'])
+        seqkit_env = self._env('seqkit', channels=['bioconda', 'conda-forge'])
         
         try:
-            # seqkit stats
-            cmd = ['seqkit', 'stats', '-a', '-T', str(self.genome_fasta)]
-            result = self.env_manager.run_command(seqkit_env, cmd,
-                                                  capture_output=True, text=True)
+            # stats with gap (N) totals, written straight to file by the child process
+            output_file = self.telomere_dir / 'seqkit_stats.tsv'
+            cmd = self.SEQKIT_STATS_ARGS + [self._genome_fasta_s]
+            with open(output_file, 'wb') as stats_out:
+                result = self.env_manager.run_command(seqkit_env, cmd,
+                                                      stdout=stats_out, stderr=subprocess.PIPE,
+                                                      text=True)
             
             if result.returncode == 0:
-                output_file = self.telomere_dir / 'seqkit_stats.tsv'
-                output_file.write_text(result.stdout)
-                logger.info(f"seqkit stats saved to {output_file}")
-                
-                # Count gaps (N's)
-                cmd_gap = ['seqkit', 'fx2tab', '-n', '-g', str(self.genome_fasta)]
-                result_gap = self.env_manager.run_command(seqkit_env, cmd_gap,
-                                                         capture_output=True, text=True)
+                logger.info("seqkit stats (including gap counts) saved to %s", output_file)
+                gap_file = self._count_gaps()
+                logger.info("Per-sequence N counts saved to %s", gap_file)
                 
-                if result_gap.returncode == 0:
-                    gap_file = self.telomere_dir / 'gap_content.tsv'
-                    gap_file.write_text(result_gap.stdout)
-                    logger.info(f"Gap content saved to {gap_file}")
-                
-                self.results['telomere_gap'] = {
+                self._set_result('telomere_gap', {
                     'tool': 'seqkit',
                     'status': 'success',
                     'stats_file': str(output_file),
+                    'gap_file': str(gap_file),
                     'note': 'No visualization available without quartet'
-                }
+                })
             else:
-                logger.error(f"seqkit failed: {result.stderr}")
-                self.results['telomere_gap'] = {
+                logger.error("seqkit failed: %s", result.stderr)
+                self._set_result('telomere_gap', {
                     'tool': 'seqkit',
                     'status': 'failed',
                     'error': result.stderr
-                }
+                })
         except Exception as e:
-            logger.error(f"Error running seqkit: {e}")
-            self.results['telomere_gap'] = {
+            logger.error("Error running seqkit: %s", e)
+            self._set_result('telomere_gap', {
                 'tool': 'seqkit',
                 'status': 'error',
                 'error': str(e)
-            }
+            })
+    
+    def _count_gaps(self, chunk: int = 1 << 26) -> Path:
+        """
+        Write the length and N count of every sequence to gap_counts.tsv
+        
+        Counted in-process on the memory-mapped FASTA with bytes.count, which
+        runs at memchr speed, instead of another seqkit pass. Records are
+        scanned in chunk-sized slices so a chromosome is never copied whole.
+        """
+        gap_file = self.telomere_dir / 'gap_counts.tsv'
+        with open(self.genome_fasta, 'rb') as f, open(gap_file, 'w') as out:
+            out.write("#id\tlength\tN\n")
+            if not os.fstat(f.fileno()).st_size:
+                return gap_file
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                start = mm.find(b'>')
+                while start != -1:
+                    header_end = mm.find(b'\n', start)
+                    if header_end == -1:
+                        header_end = len(mm)
+                    next_record = mm.find(b'\n>', header_end)
+                    stop = len(mm) if next_record == -1 else next_record
+                    
+                    length = gaps = 0
+                    for pos in range(header_end, stop, chunk):
+                        block = mm[pos:min(pos + chunk, stop)]
+                        gaps += block.count(b'N') + block.count(b'n')
+                        length += len(block) - block.count(b'\n') - block.count(b'\r')
+                    
+                    seq_id = (mm[start + 1:header_end].split() or [b''])[0].decode(errors='replace')
+                    out.write(f"{seq_id}\t{length}\t{gaps}\n")
+                    start = -1 if next_record == -1 else next_record + 1
+        return gap_file
+    
+    def _resolve_busco_dbs(self) -> List[Tuple[str, Path, bool]]:
+        """
+        Classify BUSCO databases as local directories or remote lineage names
+        
+        Each parent directory is listed once with os.scandir instead of
+        stat-ing every database path separately.
+        
+        Returns:
+            List of (db, db_path, is_local) tuples in input order
+        """
+        listings = {}
+        resolved = []
+        
+        for db in self.busco_dbs:
+            db_path = Path(db)
+            parent = db_path.parent
+            if parent not in listings:
+                try:
+                    with os.scandir(parent) as entries:
+                        listings[parent] = {entry.name: entry for entry in entries}
+                except OSError:
+                    listings[parent] = {}
+            
+            entry = listings[parent].get(db_path.name)
+            resolved.append((db, db_path, entry is not None and entry.is_dir()))
+        
+        return resolved
     
     def run_busco(self):
         """Run BUSCO analysis"""
@@ -557,121 +1398,199 @@ class GenomeQC:
         logger.info("=" * 60)
         
         if self.cluster_mode:
-            # In cluster mode, create a separate job for each BUSCO database
-            self.results['busco'] = {}
+            # In cluster mode, run each BUSCO database as one sub-job of a PBS array
+            self._set_result('busco', {})
+            db_commands = []
             
-            for db in self.busco_dbs:
-                db_path = Path(db)
-                is_local = db_path.exists()
-                
+            # Values shared by every database, filled into the template once per run
+            ctx = {'genome': self._genome_fasta_s, 'threads': self.threads}
+            
+            for db, db_path, is_local in self._resolve_busco_dbs():
                 if is_local:
                     db_name = db_path.name
-                    lineage_name = db_name
+                    extra = f' --download_path {db_path.parent} --offline'
                 else:
                     db_name = db
-                    lineage_name = db
-                
-                output_name = f"busco_{db_name}"
-                
-                # Build command
-                cmd_parts = [
-                    'micromamba run -n busco busco',
-                    f'-i {self.genome_fasta}',
-                    f'-o {output_name}',
-                    '-m genome',
-                    f'-c {self.threads}',
-                    f'-l {lineage_name}'
-                ]
-                
-                if is_local:
-                    cmd_parts.append(f'--download_path {db_path.parent}')
-                    cmd_parts.append('--offline')
-                elif db in ['auto', 'auto-lineage']:
-                    cmd_parts.append('--auto-lineage')
-                
-                commands = [' '.join(cmd_parts)]
+                    extra = ' --auto-lineage' if db in ['auto', 'auto-lineage'] else ''
                 
-                job_id = self._create_and_submit_job(
+                command = self.BUSCO_CMD_TMPL.format_map({
+                    **ctx,
+                    'out': f"busco_{db_name}",
+                    'lineage': db_name,
+                    'extra': extra
+                })
+                db_commands.append((db_name, [command]))
+            
+            # PBS arrays need at least two sub-jobs, so a single database is a plain job
+            if len(db_commands) == 1:
+                db_name, commands = db_commands[0]
+                self._create_and_submit_job(
                     job_name=f"BUSCO_{db_name}",
                     commands=commands,
                     working_dir=self.busco_dir,
-                    env_name='busco'
+                    env_name='busco',
+                    defer_as=f'busco_{db_name}'
                 )
-                
-                if job_id:
-                    self.job_dependencies[f'busco_{db_name}'] = job_id
-                
-                logger.info(f"BUSCO job for {db_name} created: {job_id or 'dry-run'}")
+                logger.info("BUSCO job for %s queued for submission", db_name)
+                return
+            
+            job_id = self._create_and_submit_array_job(
+                job_name="BUSCO",
+                commands_per_index=[commands for _, commands in db_commands],
+                working_dir=self.busco_dir,
+                env_name='busco'
+            )
             
+            if job_id:
+                self.job_dependencies['busco'] = job_id
+            
+            logger.info("BUSCO array job for %s databases created: %s", len(db_commands), job_id or 'dry-run')
             return
         
         # Original direct execution mode
-        busco_env = self.env_manager.setup_software('busco',
-                                                     channels=['bioconda', 'conda-forge'])
+        busco_env = self._env('busco', channels=['bioconda', 'conda-forge'])
+        
+        # Databases are independent runs on the same genome, so run them side by
+        # side and split the thread budget between them
+        dbs = self._resolve_busco_dbs()
+        download_path = self._prefetch_busco_lineages(busco_env, dbs)
+        threads = self._stage_threads()
+        workers = max(1, min(len(dbs), threads))
+        # BUSCO is memory hungry; do not start more runs than available RAM can hold
+        available = _available_memory()
+        if available is not None:
+            workers = max(1, min(workers, available // self._busco_job_mem()))
+        threads_per_job = max(1, threads // workers)
+        
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(
+                lambda resolved: self._run_busco_single(busco_env, *resolved, threads_per_job,
+                                                        download_path),
+                dbs
+            )
+            # Collected locally and recorded once, so a checkpoint never sees a partial set
+            busco_results = dict(results)
+        self._set_result('busco', busco_results)
+    
+    def _busco_job_mem(self) -> int:
+        """Expected peak memory of one BUSCO run in bytes (GENOMEQC_BUSCO_MEM_GB or BUSCO_JOB_MEM_GB)"""
+        mem_gb = os.environ.get('GENOMEQC_BUSCO_MEM_GB')
+        if mem_gb:
+            try:
+                if float(mem_gb) > 0:
+                    return int(float(mem_gb) * (1 << 30))
+            except ValueError:
+                pass
+            logger.warning("Ignoring invalid GENOMEQC_BUSCO_MEM_GB=%s, using %d GB",
+                           mem_gb, self.BUSCO_JOB_MEM_GB)
+        return self.BUSCO_JOB_MEM_GB << 30
+    
+    def _prefetch_busco_lineages(self, busco_env: Dict[str, str],
+                                 dbs: List[Tuple[str, Path, bool]]) -> Optional[Path]:
+        """
+        Download all remote BUSCO lineages with a single busco call
         
-        self.results['busco'] = {}
+        The per-database runs then read the datasets offline instead of each
+        fetching them (and racing on the same busco_downloads directory).
         
-        for db in self.busco_dbs:
-            # Handle local vs remote database paths
-            db_path = Path(db)
-            is_local = db_path.exists()
+        Returns:
+            Download directory, or None if nothing was downloaded
+        """
+        lineages = [db for db, _, is_local in dbs
+                    if not is_local and db not in ['auto', 'auto-lineage']]
+        if not lineages:
+            return None
+        
+        download_path = self.busco_dir / 'busco_downloads'
+        cmd = ['busco', '--download_path', str(download_path), '--download'] + lineages
+        try:
+            result = self.env_manager.run_command(busco_env, cmd, cwd=self._busco_dir_s,
+                                                  stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                                  text=True)
+        except OSError as e:
+            logger.warning("Could not pre-download BUSCO lineages: %s", e)
+            return None
+        
+        if result.returncode != 0:
+            logger.warning("Could not pre-download BUSCO lineages, each run will fetch its own: %s",
+                          result.stderr)
+            return None
+        
+        logger.info("BUSCO lineages downloaded to %s", download_path)
+        return download_path
+    
+    def _run_busco_single(self, busco_env: Dict[str, str], db: str, db_path: Path,
+                          is_local: bool, threads: int,
+                          download_path: Optional[Path] = None) -> Tuple[str, Dict[str, str]]:
+        """
+        Run BUSCO against a single database
+        
+        Remote lineages are read offline from download_path when it is given.
+        
+        Returns:
+            Tuple of (database name, result dict for self.results['busco'])
+        """
+        if is_local:
+            # Extract lineage name from path (e.g., /path/to/eukaryota_odb10 -> eukaryota_odb10)
+            db_name = db_path.name
+            lineage_name = db_name
+        else:
+            # Remote database, use as-is
+            db_name = db
+            lineage_name = db
+        
+        logger.info("Running BUSCO with database: %s", db_name)
+        
+        output_name = f"busco_{db_name}"
+        
+        try:
+            cmd = [
+                'busco',
+                '-i', self._genome_fasta_s,
+                '-o', output_name,
+                '-m', 'genome',
+                '-c', str(threads),
+                '-l', lineage_name,
+            ]
             
             if is_local:
-                # Extract lineage name from path (e.g., /path/to/eukaryota_odb10 -> eukaryota_odb10)
-                db_name = db_path.name
-                lineage_name = db_name
+                # For local databases, specify download path (parent directory) and use offline mode
+                cmd.extend(['--download_path', str(db_path.parent)])
+                cmd.append('--offline')
             else:
-                # Remote database, use as-is
-                db_name = db
-                lineage_name = db
-            
-            logger.info(f"Running BUSCO with database: {db_name}")
-            
-            output_name = f"busco_{db_name}"
+                # For remote databases, use auto-lineage if no specific lineage provided
+                if db in ['auto', 'auto-lineage']:
+                    cmd.append('--auto-lineage')
+                elif download_path:
+                    cmd.extend(['--download_path', str(download_path), '--offline'])
+            
+            # BUSCO logs heavily; keep it on disk and only the tail in memory
+            log_dir = self.busco_dir / 'log'
+            log_dir.mkdir(exist_ok=True)
+            log_file = log_dir / f"{output_name}.log"
+            result = self.env_manager.run_command_streamed(busco_env, cmd, log_file,
+                                                           cwd=self._busco_dir_s)
             
-            try:
-                cmd = [
-                    'busco',
-                    '-i', str(self.genome_fasta),
-                    '-o', output_name,
-                    '-m', 'genome',
-                    '-c', str(self.threads),
-                    '-l', lineage_name,
-                ]
-                
-                if is_local:
-                    # For local databases, specify download path (parent directory) and use offline mode
-                    cmd.extend(['--download_path', str(db_path.parent)])
-                    cmd.append('--offline')
-                else:
-                    # For remote databases, use auto-lineage if no specific lineage provided
-                    if db in ['auto', 'auto-lineage']:
-                        cmd.append('--auto-lineage')
-                
-                result = self.env_manager.run_command(
-                    busco_env, cmd,
-                    cwd=str(self.busco_dir),
-                    capture_output=True, text=True
-                )
-                
-                if result.returncode == 0:
-                    logger.info(f"BUSCO completed for {db_name}")
-                    self.results['busco'][db_name] = {
-                        'status': 'success',
-                        'output_dir': str(self.busco_dir / output_name)
-                    }
-                else:
-                    logger.error(f"BUSCO failed for {db_name}: {result.stderr}")
-                    self.results['busco'][db_name] = {
-                        'status': 'failed',
-                        'error': result.stderr
-                    }
-            except Exception as e:
-                logger.error(f"Error running BUSCO for {db_name}: {e}")
-                self.results['busco'][db_name] = {
-                    'status': 'error',
-                    'error': str(e)
+            if result.returncode == 0:
+                logger.info("BUSCO completed for %s", db_name)
+                return db_name, {
+                    'status': 'success',
+                    'output_dir': str(self.busco_dir / output_name),
+                    'log': str(log_file)
                 }
+            
+            logger.error("BUSCO failed for %s: %s", db_name, result.stderr)
+            return db_name, {
+                'status': 'failed',
+                'error': result.stderr,
+                'log': str(log_file)
+            }
+        except Exception as e:
+            logger.error("Error running BUSCO for %s: %s", db_name, e)
+            return db_name, {
+                'status': 'error',
+                'error': str(e)
+            }
     
     def run_merqury(self):
         """Run Merqury for QV calculation"""
@@ -682,109 +1601,136 @@ class GenomeQC:
         if not self.reads:
             logger.warning("No sequencing reads provided")
             logger.warning("Skipping Merqury - requires raw sequencing reads for k-mer counting")
-            self.results['merqury'] = {
+            self._set_result('merqury', {
                 'status': 'skipped',
                 'note': 'Requires raw sequencing reads for k-mer database generation'
-            }
+            })
             return
         
         if self.cluster_mode:
             # Generate PBS job for Merqury analysis
-            genome_name = self.genome_fasta.stem
-            meryl_db = self.merqury_dir / f"{genome_name}_reads.meryl"
+            meryl_db = self.merqury_dir / f"{self.genome_stem}_reads.meryl"
             
             # Build meryl k-mer counting and merqury commands
             reads_str = ' '.join(str(r) for r in self.reads)
             commands = [
                 "# Step 1: Count k-mers with meryl",
-                f"micromamba run -n merqury meryl k=21 count output {meryl_db} {reads_str}",
+                f"micromamba run -n merqury meryl k=21 count threads={self.threads} output {meryl_db} {reads_str}",
                 "",
                 "# Step 2: Run merqury",
-                f"micromamba run -n merqury merqury.sh {meryl_db} {self.genome_fasta} {genome_name}"
+                f"micromamba run -n merqury merqury.sh {meryl_db} {self._genome_fasta_s} {self.genome_stem}"
             ]
             
-            job_id = self._create_and_submit_job(
+            self._create_and_submit_job(
                 job_name="MERQURY",
                 commands=commands,
                 working_dir=self.merqury_dir,
-                env_name='merqury'
+                env_name='merqury',
+                defer_as='merqury'
             )
             
-            if job_id:
-                self.job_dependencies['merqury'] = job_id
-            
-            logger.info(f"Merqury job created: {job_id or 'dry-run'}")
+            logger.info("Merqury job queued for submission")
             return
         
         # Original direct execution mode
-        merqury_env = self.env_manager.setup_software('merqury',
-                                                       channels=['bioconda', 'conda-forge'])
+        merqury_env = self._env('merqury', channels=['bioconda', 'conda-forge'])
         
         try:
-            genome_name = self.genome_fasta.stem
-            meryl_db = self.merqury_dir / f"{genome_name}_reads.meryl"
+            meryl_db = self.merqury_dir / f"{self.genome_stem}_reads.meryl"
+            log_dir = self.merqury_dir / 'log'
+            log_dir.mkdir(exist_ok=True)
             
             # Step 1: Count k-mers with meryl
             logger.info("Counting k-mers with meryl...")
-            cmd_meryl = ['meryl', 'k=21', 'count', 'output', str(meryl_db)]
-            cmd_meryl.extend([str(r) for r in self.reads])
-            
-            result = self.env_manager.run_command(
-                merqury_env, cmd_meryl,
-                cwd=str(self.merqury_dir),
-                capture_output=True, text=True
-            )
+            result = self._count_kmers(merqury_env, meryl_db, self._stage_threads())
             
             if result.returncode != 0:
-                logger.error(f"meryl failed: {result.stderr}")
-                self.results['merqury'] = {
+                logger.error("meryl failed: %s", result.stderr)
+                self._set_result('merqury', {
                     'status': 'failed',
                     'error': f'meryl k-mer counting failed: {result.stderr}'
-                }
+                })
                 return
             
-            logger.info(f"K-mer database created: {meryl_db}")
+            logger.info("K-mer database created: %s", meryl_db)
             
             # Step 2: Run merqury
             logger.info("Running merqury...")
-            cmd_merqury = ['merqury.sh', str(meryl_db), str(self.genome_fasta), genome_name]
+            cmd_merqury = ['merqury.sh', str(meryl_db), self._genome_fasta_s, self.genome_stem]
             
-            result = self.env_manager.run_command(
-                merqury_env, cmd_merqury,
-                cwd=str(self.merqury_dir),
-                capture_output=True, text=True
-            )
+            result = self.env_manager.run_command_streamed(merqury_env, cmd_merqury,
+                                                           log_dir / 'merqury.log',
+                                                           cwd=str(self.merqury_dir))
             
             if result.returncode == 0:
                 logger.info("Merqury completed successfully")
                 
                 # Check for output files
-                qv_file = self.merqury_dir / f"{genome_name}.qv"
-                completeness_file = self.merqury_dir / f"{genome_name}.completeness.stats"
+                qv_file = self.merqury_dir / f"{self.genome_stem}.qv"
+                completeness_file = self.merqury_dir / f"{self.genome_stem}.completeness.stats"
                 
-                self.results['merqury'] = {
+                self._set_result('merqury', {
                     'status': 'success',
                     'output_dir': str(self.merqury_dir),
                     'meryl_db': str(meryl_db),
                     'qv_file': str(qv_file) if qv_file.exists() else 'not found',
                     'completeness_file': str(completeness_file) if completeness_file.exists() else 'not found'
-                }
+                })
                 
                 # Log QV if available
                 if qv_file.exists():
-                    logger.info(f"QV results: {qv_file.read_text()}")
+                    logger.info("QV results: %s", qv_file.read_text())
             else:
-                logger.error(f"Merqury failed: {result.stderr}")
-                self.results['merqury'] = {
+                logger.error("Merqury failed: %s", result.stderr)
+                self._set_result('merqury', {
                     'status': 'failed',
                     'error': result.stderr
-                }
+                })
         except Exception as e:
-            logger.error(f"Error running Merqury: {e}")
-            self.results['merqury'] = {
+            logger.error("Error running Merqury: %s", e)
+            self._set_result('merqury', {
                 'status': 'error',
                 'error': str(e)
-            }
+            })
+    
+    def _count_kmers(self, merqury_env: Dict[str, str], meryl_db: Path,
+                     threads: int) -> subprocess.CompletedProcess:
+        """
+        Count the k-mers of all read files into meryl_db
+        
+        With several read files, each one is counted into its own database at
+        the same time (splitting the threads) and the parts are merged with
+        `meryl union-sum`. Output goes to one log per meryl call under log/.
+        """
+        log_dir = self.merqury_dir / 'log'
+        
+        def count(reads: Path, output: Path, count_threads: int) -> subprocess.CompletedProcess:
+            cmd = ['meryl', 'k=21', 'count', f'threads={count_threads}', 'output', str(output), str(reads)]
+            return self.env_manager.run_command_streamed(merqury_env, cmd,
+                                                         log_dir / f"meryl_count.{output.stem}.log",
+                                                         cwd=str(self.merqury_dir))
+        
+        if len(self.reads) == 1:
+            return count(self.reads[0], meryl_db, threads)
+        
+        parts = [self.merqury_dir / f"{meryl_db.stem}.part{i}.meryl" for i in range(len(self.reads))]
+        workers = max(1, min(len(parts), threads))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(count, self.reads, parts,
+                                        [max(1, threads // workers)] * len(parts)))
+        
+        for result in results:
+            if result.returncode != 0:
+                return result
+        
+        cmd_merge = ['meryl', 'union-sum', 'output', str(meryl_db)] + [str(part) for part in parts]
+        result = self.env_manager.run_command_streamed(merqury_env, cmd_merge,
+                                                       log_dir / 'meryl_union_sum.log',
+                                                       cwd=str(self.merqury_dir))
+        if result.returncode == 0:
+            for part in parts:
+                shutil.rmtree(part, ignore_errors=True)
+        return result
     
     def run_coverage_analysis(self):
         """Run coverage analysis using minimap2 and mosdepth"""
@@ -795,17 +1741,16 @@ class GenomeQC:
         if not self.reads:
             logger.warning("No sequencing reads provided")
             logger.warning("Skipping coverage analysis - requires raw sequencing reads")
-            self.results['coverage'] = {
+            self._set_result('coverage', {
                 'status': 'skipped',
                 'note': 'Requires raw sequencing reads for alignment'
-            }
+            })
             return
         
         if self.cluster_mode:
             # Generate PBS job for coverage analysis
-            genome_name = self.genome_fasta.stem
-            sam_file = self.coverage_dir / f"{genome_name}.sam"
-            sorted_bam = self.coverage_dir / f"{genome_name}.sorted.bam"
+            sam_file = self.coverage_dir / f"{self.genome_stem}.sam"
+            sorted_bam = self.coverage_dir / f"{self.genome_stem}.sorted.bam"
             
             # Build alignment and coverage commands
             reads_str = ' '.join(str(r) for r in self.reads)
@@ -814,7 +1759,7 @@ class GenomeQC:
                 "set -o pipefail",
                 "",
                 "# Step 1: Align reads to assembly with minimap2",
-                f"micromamba run -n minimap2 minimap2 -ax map-ont -t {self.threads} {self.genome_fasta} {reads_str} > {sam_file}",
+                f"micromamba run -n minimap2 minimap2 -ax map-ont -t {self.threads} {self._genome_fasta_s} {reads_str} > {sam_file}",
                 "",
                 "# Step 2: Convert SAM to BAM and sort",
                 f"micromamba run -n samtools samtools view -@ {self.threads} -b {sam_file} | micromamba run -n samtools samtools sort -@ {self.threads} -o {sorted_bam}",
@@ -823,42 +1768,36 @@ class GenomeQC:
                 f"micromamba run -n samtools samtools index {sorted_bam}",
                 "",
                 "# Step 4: Calculate coverage with mosdepth (output in coverage directory)",
-                f"cd {self.coverage_dir} && micromamba run -n mosdepth mosdepth -t {self.threads} {genome_name} {sorted_bam}",
+                f"cd {self.coverage_dir} && micromamba run -n mosdepth mosdepth -t {self.threads} {self.genome_stem} {sorted_bam}",
                 "",
                 "# Clean up intermediate SAM file to save space",
                 f"rm -f {sam_file}"
             ]
             
-            job_id = self._create_and_submit_job(
+            self._create_and_submit_job(
                 job_name="COVERAGE",
                 commands=commands,
                 working_dir=self.coverage_dir,
-                env_name='minimap2'
+                env_name='minimap2',
+                defer_as='coverage'
             )
             
-            if job_id:
-                self.job_dependencies['coverage'] = job_id
-            
-            logger.info(f"Coverage analysis job created: {job_id or 'dry-run'}")
+            logger.info("Coverage analysis job queued for submission")
             return
         
         # Original direct execution mode
-        minimap2_env = self.env_manager.setup_software('minimap2',
-                                                        channels=['bioconda', 'conda-forge'])
-        samtools_env = self.env_manager.setup_software('samtools',
-                                                        channels=['bioconda', 'conda-forge'])
-        mosdepth_env = self.env_manager.setup_software('mosdepth',
-                                                        channels=['bioconda', 'conda-forge'])
+        minimap2_env = self._env('minimap2', channels=['bioconda', 'conda-forge'])
+        samtools_env = self._env('samtools', channels=['bioconda', 'conda-forge'])
+        mosdepth_env = self._env('mosdepth', channels=['bioconda', 'conda-forge'])
         
         try:
-            genome_name = self.genome_fasta.stem
-            sam_file = self.coverage_dir / f"{genome_name}.sam"
-            sorted_bam = self.coverage_dir / f"{genome_name}.sorted.bam"
+            sam_file = self.coverage_dir / f"{self.genome_stem}.sam"
+            sorted_bam = self.coverage_dir / f"{self.genome_stem}.sorted.bam"
             
             # Step 1: Align reads with minimap2
             logger.info("Aligning reads with minimap2...")
-            cmd_minimap2 = ['minimap2', '-ax', 'map-ont', '-t', str(self.threads),
-                           str(self.genome_fasta)]
+            cmd_minimap2 = ['minimap2', '-ax', 'map-ont', '-t', str(self._stage_threads()),
+                           self._genome_fasta_s]
             cmd_minimap2.extend([str(r) for r in self.reads])
             
             with open(sam_file, 'w') as sam_out:
@@ -868,49 +1807,35 @@ class GenomeQC:
                 )
             
             if result.returncode != 0:
-                logger.error(f"minimap2 failed: {result.stderr}")
-                self.results['coverage'] = {
+                logger.error("minimap2 failed: %s", result.stderr)
+                self._set_result('coverage', {
                     'status': 'failed',
                     'error': f'minimap2 alignment failed: {result.stderr}'
-                }
+                })
                 return
             
-            logger.info(f"Alignment completed: {sam_file}")
+            logger.info("Alignment completed: %s", sam_file)
             
-            # Step 2: Convert SAM to BAM and sort
+            # Step 2: Convert SAM to BAM and sort; samtools sort reads the SAM itself,
+            # so the BAM never passes through Python memory
             logger.info("Converting and sorting BAM file...")
-            cmd_view = ['samtools', 'view', '-@', str(self.threads), '-b', str(sam_file)]
-            cmd_sort = ['samtools', 'sort', '-@', str(self.threads), '-o', str(sorted_bam)]
-            
-            # Pipe view output to sort input
-            view_result = self.env_manager.run_command(
-                samtools_env, cmd_view,
-                capture_output=True
-            )
-            
-            if view_result.returncode != 0:
-                logger.error(f"samtools view failed: {view_result.stderr}")
-                self.results['coverage'] = {
-                    'status': 'failed',
-                    'error': 'samtools view failed'
-                }
-                return
+            cmd_sort = ['samtools', 'sort', '-@', str(self._stage_threads()),
+                        '-o', str(sorted_bam), str(sam_file)]
             
             sort_result = self.env_manager.run_command(
                 samtools_env, cmd_sort,
-                input=view_result.stdout,
-                capture_output=True
+                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
             )
             
             if sort_result.returncode != 0:
-                logger.error(f"samtools sort failed: {sort_result.stderr}")
-                self.results['coverage'] = {
+                logger.error("samtools sort failed: %s", sort_result.stderr)
+                self._set_result('coverage', {
                     'status': 'failed',
                     'error': 'samtools sort failed'
-                }
+                })
                 return
             
-            logger.info(f"BAM file sorted: {sorted_bam}")
+            logger.info("BAM file sorted: %s", sorted_bam)
             
             # Step 3: Index BAM file
             logger.info("Indexing BAM file...")
@@ -918,28 +1843,28 @@ class GenomeQC:
             
             result = self.env_manager.run_command(
                 samtools_env, cmd_index,
-                capture_output=True, text=True
+                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
             )
             
             if result.returncode != 0:
-                logger.error(f"samtools index failed: {result.stderr}")
-                self.results['coverage'] = {
+                logger.error("samtools index failed: %s", result.stderr)
+                self._set_result('coverage', {
                     'status': 'failed',
                     'error': 'samtools index failed'
-                }
+                })
                 return
             
             logger.info("BAM file indexed")
             
             # Step 4: Run mosdepth
             logger.info("Running mosdepth for coverage analysis...")
-            cmd_mosdepth = ['mosdepth', '-t', str(self.threads),
-                           genome_name, str(sorted_bam)]
+            cmd_mosdepth = ['mosdepth', '-t', str(self._stage_threads()),
+                           self.genome_stem, str(sorted_bam)]
             
             result = self.env_manager.run_command(
                 mosdepth_env, cmd_mosdepth,
                 cwd=str(self.coverage_dir),
-                capture_output=True, text=True
+                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
             )
             
             if result.returncode == 0:
@@ -948,36 +1873,36 @@ class GenomeQC:
                 # Clean up intermediate SAM file to save space
                 if sam_file.exists():
                     sam_file.unlink()
-                    logger.info(f"Removed intermediate SAM file: {sam_file}")
+                    logger.info("Removed intermediate SAM file: %s", sam_file)
                 
                 # Check for output files
-                summary_file = self.coverage_dir / f"{genome_name}.mosdepth.summary.txt"
-                global_dist = self.coverage_dir / f"{genome_name}.mosdepth.global.dist.txt"
+                summary_file = self.coverage_dir / f"{self.genome_stem}.mosdepth.summary.txt"
+                global_dist = self.coverage_dir / f"{self.genome_stem}.mosdepth.global.dist.txt"
                 
-                self.results['coverage'] = {
+                self._set_result('coverage', {
                     'status': 'success',
                     'output_dir': str(self.coverage_dir),
                     'bam_file': str(sorted_bam),
                     'summary_file': str(summary_file) if summary_file.exists() else 'not found',
                     'global_dist_file': str(global_dist) if global_dist.exists() else 'not found'
-                }
+                })
                 
                 # Log coverage summary if available
                 if summary_file.exists():
                     logger.info("Coverage Summary:")
                     logger.info(summary_file.read_text())
             else:
-                logger.error(f"mosdepth failed: {result.stderr}")
-                self.results['coverage'] = {
+                logger.error("mosdepth failed: %s", result.stderr)
+                self._set_result('coverage', {
                     'status': 'failed',
                     'error': result.stderr
-                }
+                })
         except Exception as e:
-            logger.error(f"Error running coverage analysis: {e}")
-            self.results['coverage'] = {
+            logger.error("Error running coverage analysis: %s", e)
+            self._set_result('coverage', {
                 'status': 'error',
                 'error': str(e)
-            }
+            })
     
     def run_ltr_analysis(self):
         """Run LTR analysis pipeline: ltrharvest, LTR_FINDER_parallel, LTR_retriever, and LAI"""
@@ -985,91 +1910,105 @@ class GenomeQC:
         logger.info("Running LTR analysis pipeline")
         logger.info("=" * 60)
         
-        genome_name = self.genome_fasta.name
-        genome_stem = self.genome_fasta.stem
-        
         if self.cluster_mode:
-            # Create a single job for the entire LTR analysis pipeline
-            index_prefix = self.ltr_dir / genome_stem
-            harvest_scn = self.ltr_dir / f"{genome_stem}.harvest.scn"
-            raw_ltr_scn = self.ltr_dir / f"{genome_name}.rawLTR.scn"
-            pass_list = self.ltr_dir / f"{genome_name}.pass.list"
-            out_file = self.ltr_dir / f"{genome_name}.out"
-            
-            commands = [
-                "# Step 1: Create genome index",
-                f"micromamba run -n genometools gt suffixerator -db {self.genome_fasta} -indexname {index_prefix} -tis -suf -lcp -des -ssp -sds -dna",
-                "",
-                "# Step 2: Run ltrharvest",
-                f"micromamba run -n genometools gt -j {self.threads} ltrharvest -index {index_prefix} -minlenltr 100 -maxlenltr 7000 -mintsd 4 -maxtsd 6 -motif TGCA -motifmis 1 -similar 85 -vic 10 -seed 20 -seqids yes > {harvest_scn}",
-                "",
-                "# Step 3: Run LTR_FINDER_parallel (if available)",
-                f"micromamba run -n ltr_finder LTR_FINDER_parallel -seq {self.genome_fasta} -threads {self.threads} -harvest_out -size 1000000 || echo 'LTR_FINDER_parallel not available or failed'",
-                "",
-                "# Step 4: Combine harvest and finder results",
-                f"cat {harvest_scn} > {raw_ltr_scn}",
-                f"if [ -f {genome_name}.finder.combine.scn ]; then cat {genome_name}.finder.combine.scn >> {raw_ltr_scn}; fi",
-                f"if [ -f {genome_stem}.finder.combine.scn ]; then cat {genome_stem}.finder.combine.scn >> {raw_ltr_scn}; fi",
-                "",
-                "# Step 5: Run LTR_retriever",
-                f"micromamba run -n ltr_retriever LTR_retriever -genome {self.genome_fasta} -inharvest {raw_ltr_scn} -threads {self.threads}",
-                "",
-                "# Step 6: Calculate LAI (if LAI software available)",
-                f"if command -v LAI &> /dev/null; then",
-                f"  LAI -genome {self.genome_fasta} -intact {pass_list} -all {out_file} -t {self.threads} || echo 'LAI calculation failed'",
-                f"else",
-                f"  echo 'LAI software not available'",
-                f"fi"
+            # Run each step as its own job so it can request a fitting number of
+            # cores; PBS enforces the order through afterok dependencies, and
+            # ltrharvest and LTR_FINDER_parallel run concurrently
+            index_prefix = self.ltr_dir / self.genome_stem
+            harvest_scn = self.ltr_dir / f"{self.genome_stem}.harvest.scn"
+            raw_ltr_scn = self.ltr_dir / f"{self.genome_name}.rawLTR.scn"
+            pass_list = self.ltr_dir / f"{self.genome_name}.pass.list"
+            out_file = self.ltr_dir / f"{self.genome_name}.out"
+            
+            # (job name, dependency key, parent dependency keys, ppn override, commands)
+            steps = [
+                ("LTR_INDEX", 'ltr_index', [], 1, [
+                    f"micromamba run -n genometools gt suffixerator -db {self._genome_fasta_s} -indexname {index_prefix} -tis -suf -lcp -des -ssp -sds -dna"
+                ]),
+                ("LTR_HARVEST", 'ltr_harvest', ['ltr_index'], None, [
+                    f"micromamba run -n genometools gt -j {self.threads} ltrharvest -index {index_prefix} -minlenltr 100 -maxlenltr 7000 -mintsd 4 -maxtsd 6 -motif TGCA -motifmis 1 -similar 85 -vic 10 -seed 20 -seqids yes > {harvest_scn}"
+                ]),
+                ("LTR_FINDER", 'ltr_finder', [], None, [
+                    f"micromamba run -n ltr_finder LTR_FINDER_parallel -seq {self._genome_fasta_s} -threads {self.threads} -harvest_out -size 1000000 || echo 'LTR_FINDER_parallel not available or failed'"
+                ]),
+                ("LTR_COMBINE", 'ltr_combine', ['ltr_harvest', 'ltr_finder'], 1, [
+                    f"cat {harvest_scn} > {raw_ltr_scn}",
+                    f"if [ -f {self.genome_name}.finder.combine.scn ]; then cat {self.genome_name}.finder.combine.scn >> {raw_ltr_scn}; fi",
+                    f"if [ -f {self.genome_stem}.finder.combine.scn ]; then cat {self.genome_stem}.finder.combine.scn >> {raw_ltr_scn}; fi"
+                ]),
+                ("LTR_RETRIEVER", 'ltr_retriever', ['ltr_combine'], None, [
+                    f"if [ ! -s {raw_ltr_scn} ]; then echo 'No LTR candidates found, skipping LTR_retriever'; exit 0; fi",
+                    f"micromamba run -n ltr_retriever LTR_retriever -genome {self._genome_fasta_s} -inharvest {raw_ltr_scn} -threads {self.threads}"
+                ]),
             ]
             
-            job_id = self._create_and_submit_job(
-                job_name="LTR_ANALYSIS",
-                commands=commands,
-                working_dir=self.ltr_dir
-            )
-            
-            if job_id:
-                self.job_dependencies['ltr_analysis'] = job_id
+            # Only schedule LAI when it is installed, rather than probing for it inside the job
+            if self._tools['LAI']:
+                steps.append(("LAI", 'lai', ['ltr_retriever'], None, [
+                    f"LAI -genome {self._genome_fasta_s} -intact {pass_list} -all {out_file} -t {self.threads} || echo 'LAI calculation failed'"
+                ]))
+            else:
+                logger.warning("LAI software not available, no LAI job will be created")
+            
+            for job_name, key, parents, ppn, commands in steps:
+                dependencies = [self.job_dependencies[parent] for parent in parents
+                                if parent in self.job_dependencies]
+                if not self.dry_run and len(dependencies) != len(parents):
+                    logger.error("Skipping %s: a job it depends on was not submitted", job_name)
+                    continue
+                
+                job_id = self._create_and_submit_job(
+                    job_name=job_name,
+                    commands=commands,
+                    working_dir=self.ltr_dir,
+                    dependencies=dependencies,
+                    ppn=ppn
+                )
+                
+                if job_id:
+                    self.job_dependencies[key] = job_id
+                
+                logger.info("%s job created: %s", job_name, job_id or 'dry-run')
             
-            logger.info(f"LTR analysis job created: {job_id or 'dry-run'}")
             return
         
         # Original direct execution mode
         # Setup environments
-        genometools_env = self.env_manager.setup_software('genometools', 
-                                                          channels=['bioconda', 'conda-forge'])
-        ltr_retriever_env = self.env_manager.setup_software('ltr_retriever',
-                                                             channels=['bioconda', 'conda-forge'])
-        ltr_finder_env = self.env_manager.setup_software('ltr_finder',
-                                                         channels=['bioconda', 'conda-forge'])
+        genometools_env = self._env('genometools', channels=['bioconda', 'conda-forge'])
+        ltr_retriever_env = self._env('ltr_retriever', channels=['bioconda', 'conda-forge'])
+        ltr_finder_env = self._env('ltr_finder', channels=['bioconda', 'conda-forge'])
         
         try:
             
+            # Tool output is streamed to log files, as in cluster mode
+            log_dir = self.ltr_dir / 'log'
+            log_dir.mkdir(exist_ok=True)
+            
             # Step 1: Create genome index for genometools
             logger.info("Creating genome index with gt suffixerator...")
-            index_prefix = self.ltr_dir / genome_stem
+            index_prefix = self.ltr_dir / self.genome_stem
             
             # gt suffixerator with all required indices
             cmd_index = ['gt', 'suffixerator',
-                        '-db', str(self.genome_fasta),
+                        '-db', self._genome_fasta_s,
                         '-indexname', str(index_prefix),
                         '-tis', '-suf', '-lcp', '-des', '-ssp', '-sds', '-dna']
             
-            result = self.env_manager.run_command(genometools_env, cmd_index,
-                                                  capture_output=True, text=True)
+            result = self.env_manager.run_command_streamed(genometools_env, cmd_index,
+                                                           log_dir / 'gt_suffixerator.log')
             
             if result.returncode != 0:
-                logger.error(f"Failed to create genome index: {result.stderr}")
-                self.results['ltr_analysis'] = {'status': 'failed', 'error': 'Index creation failed'}
+                logger.error("Failed to create genome index: %s", result.stderr)
+                self._set_result('ltr_analysis', {'status': 'failed', 'error': 'Index creation failed'})
                 return
             
             logger.info("Genome index created successfully")
             
             # Step 2: Run ltrharvest with specific parameters
             logger.info("Running gt ltrharvest...")
-            harvest_scn = self.ltr_dir / f"{genome_stem}.harvest.scn"
+            harvest_scn = self.ltr_dir / f"{self.genome_stem}.harvest.scn"
             
-            cmd_ltr = ['gt', '-j', str(self.threads), 'ltrharvest',
+            cmd_ltr = ['gt', '-j', str(self._stage_threads()), 'ltrharvest',
                       '-index', str(index_prefix),
                       '-minlenltr', '100',
                       '-maxlenltr', '7000',
@@ -1082,16 +2021,17 @@ class GenomeQC:
                       '-seed', '20',
                       '-seqids', 'yes']
             
-            result = self.env_manager.run_command(genometools_env, cmd_ltr,
-                                                  capture_output=True, text=True)
+            # ltrharvest writes the .scn file directly instead of through Python memory
+            with open(harvest_scn, 'wb') as scn_out:
+                result = self.env_manager.run_command(genometools_env, cmd_ltr,
+                                                      stdout=scn_out, stderr=subprocess.PIPE,
+                                                      text=True)
             
             if result.returncode == 0:
-                # Save output to .scn file
-                harvest_scn.write_text(result.stdout)
-                logger.info(f"ltrharvest completed, output saved to {harvest_scn}")
+                logger.info("ltrharvest completed, output saved to %s", harvest_scn)
             else:
-                logger.error(f"ltrharvest failed: {result.stderr}")
-                self.results['ltr_analysis'] = {'status': 'failed', 'error': 'ltrharvest failed'}
+                logger.error("ltrharvest failed: %s", result.stderr)
+                self._set_result('ltr_analysis', {'status': 'failed', 'error': 'ltrharvest failed'})
                 return
             
             # Step 3: Run LTR_FINDER_parallel (if available)
@@ -1101,125 +2041,135 @@ class GenomeQC:
             # But we need to check for various possible output filenames
             finder_scn = None
             possible_finder_files = [
-                self.ltr_dir / f"{genome_name}.finder.combine.scn",
-                self.ltr_dir / f"{genome_stem}.finder.combine.scn",
-                self.ltr_dir / f"{genome_name}.finder.scn"
+                self.ltr_dir / f"{self.genome_name}.finder.combine.scn",
+                self.ltr_dir / f"{self.genome_stem}.finder.combine.scn",
+                self.ltr_dir / f"{self.genome_name}.finder.scn"
             ]
             
-            # Check if LTR_FINDER_parallel is available
-            try:
+            # An environment or module provides the tool; a system fallback needs it on PATH
+            if ltr_finder_env['method'] != 'system' or self._tools['LTR_FINDER_parallel']:
                 cmd_finder = ['LTR_FINDER_parallel',
-                            '-seq', str(self.genome_fasta),
-                            '-threads', str(self.threads),
+                            '-seq', self._genome_fasta_s,
+                            '-threads', str(self._stage_threads()),
                             '-harvest_out',
                             '-size', '1000000']
                 
-                result = self.env_manager.run_command(ltr_finder_env, cmd_finder,
-                                                      cwd=str(self.ltr_dir),
-                                                      capture_output=True, text=True)
+                result = self.env_manager.run_command_streamed(ltr_finder_env, cmd_finder,
+                                                               log_dir / 'LTR_FINDER_parallel.log',
+                                                               cwd=self._ltr_dir_s)
                 
                 if result.returncode == 0:
                     logger.info("LTR_FINDER_parallel completed")
-                    # Find which output file was actually created
+                    # Find which output file was actually created, listing the directory once
+                    with os.scandir(self.ltr_dir) as entries:
+                        present = {entry.name for entry in entries}
                     for possible_file in possible_finder_files:
-                        if possible_file.exists():
+                        if possible_file.name in present:
                             finder_scn = possible_file
-                            logger.info(f"Found LTR_FINDER output: {finder_scn}")
+                            logger.info("Found LTR_FINDER output: %s", finder_scn)
                             break
                 else:
-                    logger.warning(f"LTR_FINDER_parallel warning: {result.stderr}")
-            except Exception as e:
-                logger.warning(f"LTR_FINDER_parallel not available or failed: {e}")
+                    logger.warning("LTR_FINDER_parallel warning: %s", result.stderr)
+            else:
+                logger.warning("LTR_FINDER_parallel not available, using ltrharvest results only")
             
             # Step 4: Combine harvest and finder results
             logger.info("Combining LTR results...")
-            raw_ltr_scn = self.ltr_dir / f"{genome_name}.rawLTR.scn"
-            
-            # Combine the two .scn files carefully
-            # Read harvest content
-            harvest_content = ""
-            if harvest_scn.exists():
-                harvest_content = harvest_scn.read_text()
-            
-            # Read finder content if available
-            finder_content = ""
-            if finder_scn and finder_scn.exists():
-                finder_content = finder_scn.read_text()
-            
-            # Combine contents
-            # If both files exist, combine them; otherwise use whichever is available
-            if harvest_content and finder_content:
-                # Simple concatenation is acceptable for .scn format
-                # as LTR_retriever will handle deduplication and validation
-                combined_content = harvest_content.rstrip() + "\n" + finder_content
-            elif harvest_content:
-                combined_content = harvest_content
-            elif finder_content:
-                combined_content = finder_content
-            else:
+            raw_ltr_scn = self.ltr_dir / f"{self.genome_name}.rawLTR.scn"
+            
+            # Simple concatenation is acceptable for .scn format as LTR_retriever
+            # will handle deduplication and validation; copy the files as bytes
+            # rather than reading them into memory
+            sources = []
+            for scn in (harvest_scn, finder_scn):
+                try:
+                    if scn and scn.stat().st_size:
+                        sources.append(scn)
+                except FileNotFoundError:
+                    pass
+            
+            if not sources:
+                # LTR_retriever fails on empty input, so do not start it at all
                 logger.warning("No LTR results found from either ltrharvest or LTR_FINDER")
-                combined_content = ""
+                self._set_result('ltr_analysis', {
+                    'status': 'skipped',
+                    'reason': 'no LTR candidates',
+                    'log_dir': str(log_dir)
+                })
+                return
             
-            raw_ltr_scn.write_text(combined_content)
-            logger.info(f"Combined LTR results saved to {raw_ltr_scn}")
+            with open(raw_ltr_scn, 'wb') as combined:
+                for scn in sources:
+                    with open(scn, 'rb') as f:
+                        shutil.copyfileobj(f, combined, 1 << 20)
+                        # Start the next file's records on a new line
+                        f.seek(-1, os.SEEK_END)
+                        if f.read(1) != b"\n":
+                            combined.write(b"\n")
+            logger.info("Combined LTR results saved to %s", raw_ltr_scn)
             
             # Step 5: Run LTR_retriever
             logger.info("Running LTR_retriever...")
             
             cmd_retriever = ['LTR_retriever',
-                           '-genome', str(self.genome_fasta),
+                           '-genome', self._genome_fasta_s,
                            '-inharvest', str(raw_ltr_scn),
-                           '-threads', str(self.threads)]
+                           '-threads', str(self._stage_threads())]
             
-            result = self.env_manager.run_command(ltr_retriever_env, cmd_retriever,
-                                                  cwd=str(self.ltr_dir),
-                                                  capture_output=True, text=True)
+            result = self.env_manager.run_command_streamed(ltr_retriever_env, cmd_retriever,
+                                                           log_dir / 'LTR_retriever.log',
+                                                           cwd=self._ltr_dir_s)
             
             if result.returncode != 0:
-                logger.warning(f"LTR_retriever warning/error: {result.stderr}")
+                logger.warning("LTR_retriever warning/error: %s", result.stderr)
             else:
                 logger.info("LTR_retriever completed")
             
             # Step 6: Calculate LAI (if LAI software is available)
-            logger.info("Checking for LAI software...")
-            pass_list = self.ltr_dir / f"{genome_name}.pass.list"
-            out_file = self.ltr_dir / f"{genome_name}.out"
-            
-            if pass_list.exists() and out_file.exists():
-                try:
-                    cmd_lai = ['LAI',
-                              '-genome', str(self.genome_fasta),
-                              '-intact', str(pass_list),
-                              '-all', str(out_file),
-                              '-t', str(self.threads)]
-                    
-                    result = subprocess.run(cmd_lai, cwd=str(self.ltr_dir),
-                                          capture_output=True, text=True)
-                    
-                    if result.returncode == 0:
-                        logger.info("LAI calculation completed")
-                    else:
-                        logger.warning(f"LAI calculation warning: {result.stderr}")
-                except Exception as e:
-                    logger.warning(f"LAI software not available: {e}")
+            pass_list = self.ltr_dir / f"{self.genome_name}.pass.list"
+            out_file = self.ltr_dir / f"{self.genome_name}.out"
+            
+            with os.scandir(self.ltr_dir) as entries:
+                present = {entry.name for entry in entries}
+            
+            lai_status = 'skipped'
+            if not self._tools['LAI']:
+                logger.warning("LAI software not available, skipping LAI calculation")
+            elif pass_list.name in present and out_file.name in present:
+                cmd_lai = ['LAI',
+                          '-genome', self._genome_fasta_s,
+                          '-intact', str(pass_list),
+                          '-all', str(out_file),
+                          '-t', str(self._stage_threads())]
+                
+                result = self.env_manager.run_command_streamed({'method': 'system'}, cmd_lai,
+                                                               log_dir / 'LAI.log',
+                                                               cwd=self._ltr_dir_s)
+                lai_status = 'attempted'
+                
+                if result.returncode == 0:
+                    logger.info("LAI calculation completed")
+                else:
+                    logger.warning("LAI calculation warning: %s", result.stderr)
             else:
                 logger.warning("LTR_retriever output files not found, skipping LAI calculation")
             
-            self.results['ltr_analysis'] = {
+            self._set_result('ltr_analysis', {
                 'status': 'completed',
                 'ltrharvest_output': str(harvest_scn),
-                'ltr_finder_output': str(finder_scn) if finder_scn and finder_scn.exists() else 'not available',
+                'ltr_finder_output': str(finder_scn) if finder_scn and finder_scn.name in present else 'not available',
                 'combined_ltr': str(raw_ltr_scn),
-                'ltr_retriever_dir': str(self.ltr_dir),
-                'lai_status': 'attempted'
-            }
+                'ltr_retriever_dir': self._ltr_dir_s,
+                'lai_status': lai_status,
+                'log_dir': str(log_dir)
+            })
             
         except Exception as e:
-            logger.error(f"Error in LTR analysis: {e}")
-            self.results['ltr_analysis'] = {
+            logger.error("Error in LTR analysis: %s", e)
+            self._set_result('ltr_analysis', {
                 'status': 'error',
                 'error': str(e)
-            }
+            })
     
     def run_quast(self):
         """Run QUAST for assembly statistics including N50"""
@@ -1229,44 +2179,33 @@ class GenomeQC:
         
         if self.cluster_mode:
             # Create job for QUAST analysis
-            cmd_parts = [
-                'micromamba run -n quast quast.py',
-                str(self.genome_fasta),
-                f'-o {self.quast_dir}',
-                f'-t {self.threads}',
-                '--min-contig 0',
-                '--plots-format png',
-                '--large'
-            ]
-            
+            extra = ''
             if self.reference_genome and self.reference_genome.exists():
-                cmd_parts.append(f'-r {self.reference_genome}')
+                extra = f' -r {self.reference_genome}'
             
-            commands = [' '.join(cmd_parts)]
+            commands = [self.QUAST_CMD_TMPL.format(genome=self._genome_fasta_s, out=self.quast_dir,
+                                                   threads=self.threads, extra=extra)]
             
-            job_id = self._create_and_submit_job(
+            self._create_and_submit_job(
                 job_name="QUAST",
                 commands=commands,
                 working_dir=self.quast_dir,
-                env_name='quast'
+                env_name='quast',
+                defer_as='quast'
             )
             
-            if job_id:
-                self.job_dependencies['quast'] = job_id
-            
-            logger.info(f"QUAST job created: {job_id or 'dry-run'}")
+            logger.info("QUAST job queued for submission")
             return
         
         # Original direct execution mode
-        quast_env = self.env_manager.setup_software('quast',
-                                                     channels=['bioconda', 'conda-forge'])
+        quast_env = self._env('quast', channels=['bioconda', 'conda-forge'])
         
         try:
             cmd = [
                 'quast.py',
-                str(self.genome_fasta),
+                self._genome_fasta_s,
                 '-o', str(self.quast_dir),
-                '-t', str(self.threads),
+                '-t', str(self._stage_threads()),
                 '--min-contig', '0',
                 '--plots-format', 'png',
                 '--large'  # Add --large flag for large genome assemblies
@@ -1274,10 +2213,12 @@ class GenomeQC:
             
             if self.reference_genome and self.reference_genome.exists():
                 cmd.extend(['-r', str(self.reference_genome)])
-                logger.info(f"Using reference genome: {self.reference_genome}")
+                logger.info("Using reference genome: %s", self.reference_genome)
             
-            result = self.env_manager.run_command(quast_env, cmd,
-                                                  capture_output=True, text=True)
+            log_dir = self.quast_dir / 'log'
+            log_dir.mkdir(exist_ok=True)
+            log_file = log_dir / 'quast.log'
+            result = self.env_manager.run_command_streamed(quast_env, cmd, log_file)
             
             if result.returncode == 0:
                 logger.info("QUAST completed successfully")
@@ -1285,37 +2226,39 @@ class GenomeQC:
                 # Parse QUAST report
                 report_file = self.quast_dir / 'report.txt'
                 if report_file.exists():
-                    report_content = report_file.read_text()
                     logger.info("QUAST report preview:")
-                    for line in report_content.split('\n')[:20]:
-                        logger.info(line)
+                    with open(report_file) as f:
+                        for line in itertools.islice(f, 20):
+                            logger.info(line.rstrip('\n'))
                 
-                self.results['quast'] = {
+                self._set_result('quast', {
                     'status': 'success',
                     'output_dir': str(self.quast_dir),
-                    'report': str(report_file)
-                }
+                    'report': str(report_file),
+                    'log': str(log_file)
+                })
             else:
-                logger.error(f"QUAST failed: {result.stderr}")
-                self.results['quast'] = {
+                logger.error("QUAST failed: %s", result.stderr)
+                self._set_result('quast', {
                     'status': 'failed',
-                    'error': result.stderr
-                }
+                    'error': result.stderr,
+                    'log': str(log_file)
+                })
         except Exception as e:
-            logger.error(f"Error running QUAST: {e}")
-            self.results['quast'] = {
+            logger.error("Error running QUAST: %s", e)
+            self._set_result('quast', {
                 'status': 'error',
                 'error': str(e)
-            }
+            })
     
     def run_synteny_analysis(self):
         """Run GenomeSyn for synteny plots"""
         if not self.reference_genome or not self.reference_genome.exists():
             logger.info("No reference genome provided, skipping synteny analysis")
-            self.results['synteny'] = {
+            self._set_result('synteny', {
                 'status': 'skipped',
                 'reason': 'No reference genome provided'
-            }
+            })
             return
         
         logger.info("=" * 60)
@@ -1325,28 +2268,26 @@ class GenomeQC:
         if not self.check_genomesyn_available():
             logger.warning("GenomeSyn not found but reference genome provided")
             logger.warning("Skipping synteny analysis")
-            self.results['synteny'] = {
+            self._set_result('synteny', {
                 'status': 'skipped',
                 'reason': 'GenomeSyn not available'
-            }
+            })
             return
         
         if self.cluster_mode:
             # Create job for synteny analysis
             commands = [
-                f"GenomeSyn -g1 {self.reference_genome} -g2 {self.genome_fasta} -o {self.synteny_dir} -t {self.threads}"
+                f"GenomeSyn -g1 {self.reference_genome} -g2 {self._genome_fasta_s} -o {self.synteny_dir} -t {self.threads}"
             ]
             
-            job_id = self._create_and_submit_job(
+            self._create_and_submit_job(
                 job_name="SYNTENY",
                 commands=commands,
-                working_dir=self.synteny_dir
+                working_dir=self.synteny_dir,
+                defer_as='synteny'
             )
             
-            if job_id:
-                self.job_dependencies['synteny'] = job_id
-            
-            logger.info(f"Synteny analysis job created: {job_id or 'dry-run'}")
+            logger.info("Synteny analysis job queued for submission")
             return
         
         # Original direct execution mode
@@ -1354,31 +2295,36 @@ class GenomeQC:
             cmd = [
                 'GenomeSyn',
                 '-g1', str(self.reference_genome),
-                '-g2', str(self.genome_fasta),
+                '-g2', self._genome_fasta_s,
                 '-o', str(self.synteny_dir),
-                '-t', str(self.threads)
+                '-t', str(self._stage_threads())
             ]
             
-            result = subprocess.run(cmd, capture_output=True, text=True)
+            log_dir = self.synteny_dir / 'log'
+            log_dir.mkdir(exist_ok=True)
+            log_file = log_dir / 'GenomeSyn.log'
+            result = self.env_manager.run_command_streamed({'method': 'system'}, cmd, log_file)
             
             if result.returncode == 0:
                 logger.info("GenomeSyn completed successfully")
-                self.results['synteny'] = {
+                self._set_result('synteny', {
                     'status': 'success',
-                    'output_dir': str(self.synteny_dir)
-                }
+                    'output_dir': str(self.synteny_dir),
+                    'log': str(log_file)
+                })
             else:
-                logger.error(f"GenomeSyn failed: {result.stderr}")
-                self.results['synteny'] = {
+                logger.error("GenomeSyn failed: %s", result.stderr)
+                self._set_result('synteny', {
                     'status': 'failed',
-                    'error': result.stderr
-                }
+                    'error': result.stderr,
+                    'log': str(log_file)
+                })
         except Exception as e:
-            logger.error(f"Error running GenomeSyn: {e}")
-            self.results['synteny'] = {
+            logger.error("Error running GenomeSyn: %s", e)
+            self._set_result('synteny', {
                 'status': 'error',
                 'error': str(e)
-            }
+            })
     
     def generate_summary(self):
         """Generate summary table of all results"""
@@ -1389,115 +2335,181 @@ class GenomeQC:
         summary_file = self.output_dir / 'summary_report.json'
         summary_txt = self.output_dir / 'summary_report.txt'
         
-        # Save JSON
+        # Save JSON; the genome digest is included when the stage cache computed it
+        genome = {'path': self._genome_fasta_s, 'size': self.genome_fasta.stat().st_size}
+        if self._genome_hash:
+            genome['blake2b'] = self._genome_hash
+        # Results are plain, acyclic dicts: skip the circular-reference walk and
+        # write any stray Path or other object as its string form
+        results = self._results_snapshot()
         with open(summary_file, 'w') as f:
-            json.dump(self.results, f, indent=2)
+            json.dump({'genome': genome, **results}, f, indent=2,
+                      check_circular=False, default=str)
         
-        logger.info(f"Summary JSON saved to: {summary_file}")
+        logger.info("Summary JSON saved to: %s", summary_file)
         
         # Create text summary
-        lines = []
-        lines.append("=" * 80)
-        lines.append("GENOME QUALITY CONTROL SUMMARY REPORT")
-        lines.append("=" * 80)
-        lines.append(f"Genome: {self.genome_fasta}")
-        lines.append(f"Output Directory: {self.output_dir}")
-        lines.append(f"Threads: {self.threads}")
-        lines.append("=" * 80)
-        lines.append("")
-        
-        # Telomere and Gap Analysis
-        lines.append("TELOMERE AND GAP ANALYSIS")
-        lines.append("-" * 80)
-        if 'telomere_gap' in self.results:
-            for key, value in self.results['telomere_gap'].items():
-                lines.append(f"  {key}: {value}")
-        lines.append("")
-        
-        # BUSCO
-        lines.append("BUSCO COMPLETENESS ASSESSMENT")
-        lines.append("-" * 80)
-        if 'busco' in self.results:
-            for db, result in self.results['busco'].items():
-                lines.append(f"  Database: {db}")
-                for key, value in result.items():
-                    lines.append(f"    {key}: {value}")
-        lines.append("")
-        
-        # Merqury
-        lines.append("MERQURY QV CALCULATION")
-        lines.append("-" * 80)
-        if 'merqury' in self.results:
-            for key, value in self.results['merqury'].items():
-                lines.append(f"  {key}: {value}")
-        lines.append("")
-        
-        # LTR Analysis
-        lines.append("LTR ANALYSIS AND LAI")
-        lines.append("-" * 80)
-        if 'ltr_analysis' in self.results:
-            for key, value in self.results['ltr_analysis'].items():
-                lines.append(f"  {key}: {value}")
-        lines.append("")
-        
-        # QUAST
-        lines.append("QUAST ASSEMBLY STATISTICS")
-        lines.append("-" * 80)
-        if 'quast' in self.results:
-            for key, value in self.results['quast'].items():
-                lines.append(f"  {key}: {value}")
-        lines.append("")
-        
-        # Synteny
-        lines.append("SYNTENY ANALYSIS")
-        lines.append("-" * 80)
-        if 'synteny' in self.results:
-            for key, value in self.results['synteny'].items():
-                lines.append(f"  {key}: {value}")
-        lines.append("")
-        
-        # Coverage Analysis
-        lines.append("COVERAGE ANALYSIS (MOSDEPTH)")
-        lines.append("-" * 80)
-        if 'coverage' in self.results:
-            for key, value in self.results['coverage'].items():
-                lines.append(f"  {key}: {value}")
-        lines.append("")
-        
-        lines.append("=" * 80)
-        lines.append("END OF REPORT")
-        lines.append("=" * 80)
+        rule = "=" * 80
+        lines = [
+            rule,
+            "GENOME QUALITY CONTROL SUMMARY REPORT",
+            rule,
+            f"Genome: {self._genome_fasta_s}",
+            f"Output Directory: {self.output_dir}",
+            f"Threads: {self.threads}",
+            rule,
+            ""
+        ]
+        
+        for key, title in self.SUMMARY_SECTIONS:
+            lines += [title, "-" * 80]
+            section = results.get(key, {})
+            if key == 'busco':
+                # One nested block per database
+                for db, result in section.items():
+                    lines.append(f"  Database: {db}")
+                    lines.extend(f"    {k}: {v}" for k, v in result.items())
+            else:
+                lines.extend(f"  {k}: {v}" for k, v in section.items())
+            lines.append("")
+        
+        lines += [rule, "END OF REPORT", rule]
         
         summary_content = '\n'.join(lines)
         summary_txt.write_text(summary_content)
         
-        logger.info(f"Summary text report saved to: {summary_txt}")
+        logger.info("Summary text report saved to: %s", summary_txt)
         logger.info("\n" + summary_content)
     
+    def plan(self, engine: str) -> Path:
+        """
+        Write the cluster-mode jobs as a workflow for an external engine
+        
+        Nothing is run or submitted. Each job becomes a bash script under
+        <output>/workflow/scripts/ and one rule or process that waits for the
+        jobs it depends on. Requires cluster mode, which defines the jobs.
+        
+        Returns:
+            Path of the workflow file
+        """
+        if not self.cluster_mode:
+            raise ValueError("Workflow planning needs cluster mode job definitions")
+        
+        self._planned_jobs = []
+        try:
+            for method, _, _ in self.STAGE_GRAPH.values():
+                getattr(self, method)()
+            self._submit_summary_job()
+            jobs = self._planned_jobs
+        finally:
+            self._planned_jobs = None
+        
+        workflow_dir = self.output_dir / 'workflow'
+        script_dir = workflow_dir / 'scripts'
+        _mkdirs_batch(workflow_dir, [script_dir])
+        
+        # Rule and process names must be identifiers (local BUSCO paths may not be)
+        rule_name = functools.partial(re.sub, r'\W', '_')
+        planned = []
+        for job_name, commands, working_dir, dependencies, threads in jobs:
+            script = script_dir / f"{rule_name(job_name)}.sh"
+            script.write_text("#!/bin/bash\nset -eo pipefail\n"
+                              f"cd {shlex.quote(str(working_dir))}\n" + "\n".join(commands) + "\n")
+            planned.append((rule_name(job_name), script, [rule_name(d) for d in dependencies], threads))
+        
+        emit = {
+            'snakemake': self._emit_snakemake,
+            'makeflow': self._emit_makeflow,
+            'nextflow': self._emit_nextflow
+        }[engine]
+        workflow_file = workflow_dir / self.WORKFLOW_FILES[engine]
+        workflow_file.write_text(emit(planned))
+        logger.info("%s workflow with %d jobs written to %s", engine, len(planned), workflow_file)
+        return workflow_file
+    
+    @staticmethod
+    def _bash_command(script: Path) -> str:
+        """Shell command running a job script, with the path quoted for the shell"""
+        return f"bash {shlex.quote(str(script))}"
+    
+    @staticmethod
+    def _emit_snakemake(jobs: List[Tuple[str, Path, List[str], int]]) -> str:
+        """Snakefile with one rule per job, chained through done/<job>.done markers"""
+        lines = ["rule all:",
+                 "    input: " + ", ".join(f'"done/{name}.done"' for name, _, _, _ in jobs), ""]
+        for name, script, dependencies, threads in jobs:
+            lines.append(f"rule {name}:")
+            if dependencies:
+                lines.append("    input: " + ", ".join(f'"done/{d}.done"' for d in dependencies))
+            lines += [f'    output: touch("done/{name}.done")',
+                      f"    threads: {threads}",
+                      # shell strings are str.format templates: braces in the path must be doubled
+                      "    shell: " + repr(GenomeQC._bash_command(script).replace('{', '{{').replace('}', '}}')),
+                      ""]
+        return "\n".join(lines)
+    
+    @staticmethod
+    def _emit_makeflow(jobs: List[Tuple[str, Path, List[str], int]]) -> str:
+        """Makeflow file with one rule per job, chained through done/<job>.done markers"""
+        lines = []
+        for name, script, dependencies, threads in jobs:
+            sources = " ".join(f"done/{d}.done" for d in dependencies)
+            lines += [f"CORES={threads}",
+                      f"done/{name}.done: {sources}".rstrip(),
+                      f"\t{GenomeQC._bash_command(script)} && mkdir -p done && touch done/{name}.done", ""]
+        return "\n".join(lines)
+    
+    @staticmethod
+    def _emit_nextflow(jobs: List[Tuple[str, Path, List[str], int]]) -> str:
+        """Nextflow DSL2 script with one process per job, ordered through value channels"""
+        lines = ["nextflow.enable.dsl = 2", ""]
+        for name, script, dependencies, threads in jobs:
+            lines += [f"process {name} {{", f"    cpus {threads}"]
+            if dependencies:
+                lines += ["    input:", "    val ready"]
+            # A double-quoted Groovy string interpolates $, so escape it, backslashes and quotes
+            command = re.sub(r'([\\"$])', r'\\\1', GenomeQC._bash_command(script))
+            lines += ["    output:", "    val true", "    script:",
+                      f'    "{command}"', "}", ""]
+        
+        lines.append("workflow {")
+        for name, _, dependencies, _ in jobs:
+            if not dependencies:
+                lines.append(f"    {name}()")
+            elif len(dependencies) == 1:
+                lines.append(f"    {name}({dependencies[0]}.out)")
+            else:
+                ready = dependencies[0] + ".out" + "".join(f".mix({d}.out)" for d in dependencies[1:])
+                lines.append(f"    {name}({ready}.collect())")
+        lines.append("}")
+        return "\n".join(lines) + "\n"
+    
     def run_pipeline(self):
         """Execute the complete QC pipeline"""
         logger.info("Starting Genome QC Pipeline")
-        logger.info(f"Genome: {self.genome_fasta}")
-        logger.info(f"Output: {self.output_dir}")
-        logger.info(f"Threads: {self.threads}")
+        logger.info("Genome: %s", self.genome_fasta)
+        logger.info("Output: %s", self.output_dir)
+        logger.info("Threads: %s", self.threads)
         
         if self.cluster_mode:
-            logger.info(f"Cluster Mode: ENABLED")
-            logger.info(f"PBS Queue: {self.pbs_manager.queue}")
-            logger.info(f"PBS Resources: nodes={self.pbs_manager.nodes}:ppn={self.pbs_manager.ppn}")
-            logger.info(f"PBS Walltime: {self.pbs_manager.walltime}")
+            logger.info("Cluster Mode: ENABLED")
+            logger.info("PBS Queue: %s", self.pbs_manager.queue)
+            logger.info("PBS Resources: nodes=%s:ppn=%s", self.pbs_manager.nodes, self.pbs_manager.ppn)
+            logger.info("PBS Walltime: %s", self.pbs_manager.walltime)
             if self.dry_run:
                 logger.info("DRY RUN MODE: Jobs will not be submitted")
         
         try:
             # Run all analyses
-            self.run_telomere_gap_analysis()
-            self.run_busco()
-            self.run_merqury()
-            self.run_coverage_analysis()
-            self.run_ltr_analysis()
-            self.run_quast()
-            self.run_synteny_analysis()
+            if self.cluster_mode:
+                for method, _, _ in self.STAGE_GRAPH.values():
+                    getattr(self, method)()
+                self._submit_pending_jobs()
+                self._submit_summary_job()
+            else:
+                completed = tuple(self._load_checkpoint()) if self.resume else ()
+                self._prewarm_envs(completed)
+                self._run_stage_graph(completed)
             
             # Generate summary only in direct execution mode
             if not self.cluster_mode:
@@ -1512,11 +2524,15 @@ class GenomeQC:
             logger.info("=" * 60)
             
         except Exception as e:
-            logger.error(f"Pipeline failed with error: {e}")
+            logger.error("Pipeline failed with error: %s", e)
+            # Still report the stages that did finish
+            if not self.cluster_mode and self._results_snapshot():
+                self.generate_summary()
             raise
 
 
-def main():
+def build_parser() -> argparse.ArgumentParser:
+    """Build the command line parser"""
     parser = argparse.ArgumentParser(
         description='Comprehensive Genome Quality Control Pipeline',
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -1530,7 +2546,7 @@ Example usage:
   # With sequencing reads for Merqury and coverage analysis
   %(prog)s -g genome.fasta -o results -t 16 -b eukaryota_odb10 --reads reads1.fastq.gz reads2.fastq.gz
   
-  # Cluster mode (PBS/Torque)
+  # Cluster mode (PBS Pro)
   %(prog)s -g genome.fasta -o results -t 60 -b eukaryota_odb10 --cluster --pbs-queue high --pbs-ppn 60
   %(prog)s -g genome.fasta -o results -t 60 -b eukaryota_odb10 --cluster --dry-run
   %(prog)s -g genome.fasta -o results -t 60 -b eukaryota_odb10 --reads reads.fastq.gz --cluster
@@ -1555,10 +2571,26 @@ Example usage:
                        help='Minimum telomere length for quartet analysis (default: 50)')
     parser.add_argument('--reads', nargs='+', default=None,
                        help='Sequencing reads (FASTQ/FASTA) for Merqury QV calculation and coverage analysis (optional)')
+    parser.add_argument('--max-parallel', dest='max_parallel', type=int, default=None,
+                       help='Maximum number of analyses to run at the same time in direct mode; '
+                            'threads are split between them (default: up to --threads)')
+    parser.add_argument('--verify-tools', dest='verify_tools', action='store_true',
+                       help='Run optional tools (quartet, GenomeSyn) with --help to confirm they work, '
+                            'instead of only checking that they are on PATH')
+    parser.add_argument('--cache-dir', dest='cache_dir', default=None,
+                       help='Directory for reusing completed analyses across runs with the same '
+                            'genome and settings (direct mode; default: no caching). Tool versions '
+                            'are not part of the cache key, so clear it after upgrading a tool')
+    parser.add_argument('--prefer-env', dest='prefer_system', action='store_false',
+                       help='Use micromamba environments or modules even for tools already on PATH '
+                            '(default: tools on PATH are run directly)')
+    parser.add_argument('--resume', action='store_true',
+                       help='Skip analyses that succeeded in the previous run into the same output '
+                            'directory (direct mode; progress is kept in <output>/.state.json)')
     
     # Cluster mode arguments
     parser.add_argument('--cluster', action='store_true',
-                       help='Enable cluster mode - generate PBS job scripts instead of running directly')
+                       help='Enable cluster mode - generate PBS Pro job scripts instead of running directly')
     parser.add_argument('--pbs-queue', dest='pbs_queue', default='high',
                        help='PBS queue name (default: high)')
     parser.add_argument('--pbs-nodes', dest='pbs_nodes', type=int, default=1,
@@ -1569,58 +2601,104 @@ Example usage:
                        help='Walltime for PBS jobs (default: 240:00:00)')
     parser.add_argument('--dry-run', action='store_true',
                        help='Generate PBS scripts but do not submit jobs')
+    parser.add_argument('--wait', action='store_true',
+                       help='Wait until all submitted PBS jobs have finished before exiting')
+    parser.add_argument('--emit-workflow', dest='emit_workflow', default=None,
+                       choices=sorted(GenomeQC.WORKFLOW_FILES),
+                       help='Write the cluster-mode jobs as a workflow for this engine under '
+                            '<output>/workflow/ instead of running or submitting anything')
+    
+    return parser
+
+
+def generate_pbs_scripts(genome_fasta: str, output_dir: str, busco_dbs: List[str],
+                         dry_run: bool = True, **options) -> GenomeQC:
+    """
+    Write the cluster-mode PBS scripts for a genome, submitting them unless dry_run
     
-    args = parser.parse_args()
+    Other keyword options (pbs_queue, pbs_ppn, reads, ...) are passed on to GenomeQC.
+    Returns the pipeline; the scripts are in its pbs_dir.
+    """
+    with GenomeQC(genome_fasta=genome_fasta, output_dir=output_dir, busco_dbs=busco_dbs,
+                  cluster_mode=True, dry_run=dry_run, **options) as pipeline:
+        pipeline.run_pipeline()
+    return pipeline
+
+
+def main():
+    args = build_parser().parse_args()
+    
+    # Configure logging here rather than at import, so importing the module
+    # leaves the logging setup of library users alone
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
     
     # Validate inputs
     if not Path(args.genome).exists():
-        logger.error(f"Genome file not found: {args.genome}")
+        logger.error("Genome file not found: %s", args.genome)
         sys.exit(1)
     
     if args.reference and not Path(args.reference).exists():
-        logger.error(f"Reference genome file not found: {args.reference}")
+        logger.error("Reference genome file not found: %s", args.reference)
         sys.exit(1)
     
     if args.reads:
         for reads_file in args.reads:
             if not Path(reads_file).exists():
-                logger.error(f"Reads file not found: {reads_file}")
+                logger.error("Reads file not found: %s", reads_file)
                 sys.exit(1)
     
-    # Create and run pipeline
-    pipeline = GenomeQC(
-        genome_fasta=args.genome,
-        output_dir=args.output,
+    options = dict(
         threads=args.threads,
-        busco_dbs=args.busco,
         reference_genome=args.reference,
         organism_type=args.organism_type,
         min_telomere_length=args.min_telomere_length,
-        cluster_mode=args.cluster,
         pbs_queue=args.pbs_queue,
         pbs_nodes=args.pbs_nodes,
         pbs_ppn=args.pbs_ppn,
         pbs_walltime=args.pbs_walltime,
-        dry_run=args.dry_run,
-        reads=args.reads
+        reads=args.reads,
+        max_parallel=args.max_parallel,
+        verify_tools=args.verify_tools,
+        cache_dir=args.cache_dir,
+        prefer_system=args.prefer_system,
+        resume=args.resume
     )
     
-    pipeline.run_pipeline()
+    # A workflow is planned from the cluster-mode jobs
+    if args.emit_workflow:
+        with GenomeQC(genome_fasta=args.genome, output_dir=args.output, busco_dbs=args.busco,
+                      cluster_mode=True, dry_run=True, **options) as pipeline:
+            pipeline.plan(args.emit_workflow)
+        return
+    
+    if not args.cluster:
+        with GenomeQC(genome_fasta=args.genome, output_dir=args.output, busco_dbs=args.busco,
+                      **options) as pipeline:
+            pipeline.run_pipeline()
+        return
+    
+    pipeline = generate_pbs_scripts(args.genome, args.output, args.busco,
+                                    dry_run=args.dry_run, **options)
     
     # In cluster mode, print summary of submitted jobs
-    if args.cluster:
-        logger.info("=" * 60)
-        logger.info("CLUSTER MODE SUMMARY")
-        logger.info("=" * 60)
-        logger.info(f"PBS scripts generated in: {pipeline.output_dir}/pbs_scripts/")
-        if args.dry_run:
-            logger.info("DRY RUN MODE - No jobs were submitted")
-        else:
-            logger.info("Submitted jobs:")
-            for job_name, job_id in pipeline.pbs_manager.submitted_jobs.items():
-                logger.info(f"  {job_name}: {job_id}")
-        logger.info("=" * 60)
-
+    logger.info("=" * 60)
+    logger.info("CLUSTER MODE SUMMARY")
+    logger.info("=" * 60)
+    logger.info("PBS scripts generated in: %s/", pipeline.pbs_dir)
+    if args.dry_run:
+        logger.info("DRY RUN MODE - No jobs were submitted")
+    else:
+        logger.info("Submitted jobs:")
+        for job_name, job_id in pipeline.pbs_manager.submitted_jobs.items():
+            logger.info("  %s: %s", job_name, job_id)
+        if args.wait:
+            states = pipeline.pbs_manager.wait_all()
+            logger.info("All PBS jobs finished: %s",
+                       ", ".join(f"{name}={state}" for name, state in states.items()))
+    logger.info("=" * 60)
 
 if __name__ == '__main__':
     main()
@@ -88,7 +88,13 @@ echo "=================================="
 echo "Running Tests"
 echo "=================================="
 echo ""
-if python3 test_pipeline.py; then
+# All test modules in one interpreter when pytest is installed; otherwise the basic checks
+if python3 -c "import pytest" 2>/dev/null; then
+    TEST_CMD="python3 -m pytest -q test_pipeline.py test_new_features.py test_cluster_mode.py"
+else
+    TEST_CMD="python3 test_pipeline.py"
+fi
+if $TEST_CMD; then
     echo ""
     echo "=================================="
     echo "Installation Complete!"
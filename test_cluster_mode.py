@@ -3,207 +3,355 @@
 Test script for cluster mode PBS script generation
 """
 
+import ast
+import os
+import re
+import shlex
 import sys
 import tempfile
 from pathlib import Path
-import subprocess
+
+import pytest
 
 # Add the current directory to path
 sys.path.insert(0, str(Path(__file__).parent))
 
-# Use the current Python interpreter for subprocess calls
-PYTHON_EXE = sys.executable
+# Required elements of a PBS script (from problem statement)
+PBS_REQUIRED_ELEMENTS = [
+    '#!/bin/bash',
+    '#PBS -N TELOMERE_GAP',
+    '#PBS -q test_queue',
+    '#PBS -l nodes=1:ppn=32',
+    '#PBS -j oe',
+    '#PBS -l walltime=240:00:00',
+    'source ~/.bashrc',
+    'pwd',
+    'WD=`pwd`',
+    'mkdir -p $WD/log',
+    'TIME=`date +%m%d_%H%M`',
+    'exec > >(tee -a'
+]
 
 
-def test_cluster_mode_help():
+def test_cluster_mode_help(help_text):
     """Test that cluster mode options appear in help"""
     print("Testing cluster mode help options...")
     
-    result = subprocess.run(
-        [PYTHON_EXE, 'genomeQC.py', '--help'],
-        capture_output=True,
-        text=True
-    )
-    
-    assert result.returncode == 0, "Help command failed"
-    assert '--cluster' in result.stdout, "Missing --cluster option in help"
-    assert '--pbs-queue' in result.stdout, "Missing --pbs-queue option in help"
-    assert '--pbs-ppn' in result.stdout, "Missing --pbs-ppn option in help"
-    assert '--dry-run' in result.stdout, "Missing --dry-run option in help"
+    assert '--cluster' in help_text, "Missing --cluster option in help"
+    assert '--pbs-queue' in help_text, "Missing --pbs-queue option in help"
+    assert '--pbs-ppn' in help_text, "Missing --pbs-ppn option in help"
+    assert '--dry-run' in help_text, "Missing --dry-run option in help"
     
     print("  ✓ Cluster mode help options present")
 
 
-def test_pbs_script_generation():
+def _cluster_dry_run(tmp_dir, busco_dbs, **options):
+    """Generate the PBS scripts for a small genome in-process and return the output directory"""
+    from genomeQC import generate_pbs_scripts
+    
+    genome_file = tmp_dir / 'test_genome.fasta'
+    genome_file.write_text(">chr1\nATCGATCGATCG\n>chr2\nGCTAGCTAGCTA\n")
+    output_dir = tmp_dir / 'output'
+    
+    generate_pbs_scripts(str(genome_file), str(output_dir), busco_dbs, threads=60, **options)
+    return output_dir
+
+
+@pytest.fixture(scope="session")
+def pbs_output_dir(tmp_path_factory):
+    """Scripts of one dry run with custom PBS parameters, shared by the script checks"""
+    return _cluster_dry_run(tmp_path_factory.mktemp('pbs'), ['eukaryota_odb10'],
+                            pbs_queue='test_queue',
+                            pbs_nodes=1,
+                            pbs_ppn=32,
+                            pbs_walltime='240:00:00')
+
+
+@pytest.fixture(scope="session")
+def busco_array_output_dir(tmp_path_factory):
+    """Scripts of one dry run with several BUSCO databases"""
+    return _cluster_dry_run(tmp_path_factory.mktemp('busco_array'), ['db1', 'db2', 'db3'])
+
+
+def test_pbs_script_generation(pbs_output_dir):
     """Test PBS script generation in dry-run mode"""
     print("\nTesting PBS script generation...")
     
-    # Create temporary test genome
+    # Check PBS scripts directory exists
+    pbs_dir = pbs_output_dir / 'pbs_scripts'
+    assert pbs_dir.exists(), "PBS scripts directory not created"
+    
+    # Check expected PBS scripts were generated
+    expected_scripts = [
+        'TELOMERE_GAP.pbs',
+        'BUSCO_eukaryota_odb10.pbs',
+        'LTR_HARVEST.pbs',
+        'QUAST.pbs'
+    ]
+    
+    for script_name in expected_scripts:
+        script_path = pbs_dir / script_name
+        assert script_path.exists(), f"PBS script {script_name} not generated"
+        
+        # Check script content
+        content = script_path.read_text()
+        assert '#!/bin/bash' in content, f"Missing shebang in {script_name}"
+        assert '#PBS -N' in content, f"Missing PBS job name in {script_name}"
+        assert '#PBS -q test_queue' in content, f"Wrong PBS queue in {script_name}"
+        assert '#PBS -l nodes=1:ppn=32' in content, f"Wrong PBS resources in {script_name}"
+        assert 'source ~/.bashrc' in content, f"Missing bashrc source in {script_name}"
+        assert 'mkdir -p $WD/log' in content, f"Missing log directory creation in {script_name}"
+        
+        print(f"  ✓ {script_name} generated correctly")
+    
+    print(f"  ✓ All PBS scripts generated successfully")
+
+
+def test_pbs_script_content(pbs_output_dir):
+    """Test PBS script content matches requirements"""
+    print("\nTesting PBS script content requirements...")
+    
+    # Check one script in detail
+    telomere_script = pbs_output_dir / 'pbs_scripts' / 'TELOMERE_GAP.pbs'
+    content = telomere_script.read_text()
+    
+    missing = [element for element in PBS_REQUIRED_ELEMENTS if element not in content]
+    assert not missing, f"Missing required elements: {missing}"
+    
+    print("  ✓ PBS script contains all required elements")
+
+
+def test_multiple_busco_databases(busco_array_output_dir):
+    """Test that multiple BUSCO databases generate a single array job"""
+    print("\nTesting multiple BUSCO database jobs...")
+    
+    pbs_dir = busco_array_output_dir / 'pbs_scripts'
+    db_names = ['db1', 'db2', 'db3']
+    
+    # Check that one array job covers every database, from a single directory listing
+    scripts = {entry.name for entry in os.scandir(pbs_dir)}
+    assert 'BUSCO.pbs' in scripts, "BUSCO array job not created"
+    separate = scripts & {f'BUSCO_{db_name}.pbs' for db_name in db_names}
+    assert not separate, f"Unexpected separate jobs: {sorted(separate)}"
+    content = (pbs_dir / 'BUSCO.pbs').read_text()
+    assert '#PBS -J 0-2' in content, "Missing PBS array range"
+    assert 'case "$PBS_ARRAY_INDEX" in' in content, "Missing array index dispatch"
+    assert 'log/BUSCO_${PBS_ARRAY_INDEX}_$TIME.log' in content, "Array logs not separated"
+    
+    for index, db_name in enumerate(db_names):
+        assert f'  {index})' in content, f"Missing array index {index}"
+        assert f'-l {db_name}' in content, f"BUSCO command for {db_name} not in array job"
+        print(f"  ✓ {db_name} dispatched as array index {index}")
+    
+    print("  ✓ Multiple BUSCO databases generate one array job")
+
+
+def test_ltr_job_chain(run_genomeqc):
+    """Test that LTR analysis is submitted as dependency-chained jobs"""
+    print("\nTesting LTR job dependency chain...")
+    
     with tempfile.TemporaryDirectory() as tmpdir:
-        genome_file = Path(tmpdir) / 'test_genome.fasta'
-        genome_file.write_text(">chr1\nATCGATCGATCG\n>chr2\nGCTAGCTAGCTA\n")
+        genome_file = Path(tmpdir) / 'test.fasta'
+        genome_file.write_text(">seq\nATCG\n")
         
         output_dir = Path(tmpdir) / 'output'
         
-        # Run in cluster dry-run mode
-        result = subprocess.run([
-            PYTHON_EXE, 'genomeQC.py',
-            '-g', str(genome_file),
-            '-o', str(output_dir),
+        # Stand-in qsub that derives the job ID from the script name
+        bin_dir = Path(tmpdir) / 'bin'
+        bin_dir.mkdir()
+        qsub = bin_dir / 'qsub'
+        qsub.write_text('#!/bin/sh\necho "$(basename "$1" .pbs).pbs01"\n')
+        qsub.chmod(0o755)
+        # The LAI job is only created when LAI is installed
+        lai = bin_dir / 'LAI'
+        lai.write_text('#!/bin/sh\n')
+        lai.chmod(0o755)
+        env = dict(os.environ, PATH=f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}")
+        
+        result = run_genomeqc([
+            '-g', genome_file,
+            '-o', output_dir,
             '-t', '60',
-            '-b', 'eukaryota_odb10',
+            '-b', 'test_db',
             '--cluster',
-            '--dry-run',
-            '--pbs-queue', 'test_queue',
             '--pbs-ppn', '32'
-        ], capture_output=True, text=True)
+        ], env=env)
         
         assert result.returncode == 0, f"Cluster mode failed: {result.stderr}"
         
-        # Check PBS scripts directory exists
         pbs_dir = output_dir / 'pbs_scripts'
-        assert pbs_dir.exists(), "PBS scripts directory not created"
-        
-        # Check expected PBS scripts were generated
-        expected_scripts = [
-            'TELOMERE_GAP.pbs',
-            'BUSCO_eukaryota_odb10.pbs',
-            'LTR_ANALYSIS.pbs',
-            'QUAST.pbs'
-        ]
-        
-        for script_name in expected_scripts:
-            script_path = pbs_dir / script_name
-            assert script_path.exists(), f"PBS script {script_name} not generated"
-            
-            # Check script content
-            content = script_path.read_text()
-            assert '#!/bin/bash' in content, f"Missing shebang in {script_name}"
-            assert '#PBS -N' in content, f"Missing PBS job name in {script_name}"
-            assert '#PBS -q test_queue' in content, f"Wrong PBS queue in {script_name}"
-            assert '#PBS -l nodes=1:ppn=32' in content, f"Wrong PBS resources in {script_name}"
-            assert 'source ~/.bashrc' in content, f"Missing bashrc source in {script_name}"
-            assert 'mkdir -p $WD/log' in content, f"Missing log directory creation in {script_name}"
-            
-            print(f"  ✓ {script_name} generated correctly")
-        
-        print(f"  ✓ All PBS scripts generated successfully")
-
-
-def test_pbs_script_content():
-    """Test PBS script content matches requirements"""
-    print("\nTesting PBS script content requirements...")
+        expected_dependencies = {
+            'LTR_INDEX': None,
+            'LTR_HARVEST': 'afterok:LTR_INDEX.pbs01',
+            'LTR_FINDER': None,
+            'LTR_COMBINE': 'afterok:LTR_HARVEST.pbs01:LTR_FINDER.pbs01',
+            'LTR_RETRIEVER': 'afterok:LTR_COMBINE.pbs01',
+            'LAI': 'afterok:LTR_RETRIEVER.pbs01'
+        }
+        
+        for job_name, dependency in expected_dependencies.items():
+            content = (pbs_dir / f'{job_name}.pbs').read_text()
+            if dependency:
+                assert f'#PBS -W depend={dependency}' in content, f"Wrong dependency in {job_name}"
+            else:
+                assert '#PBS -W depend' not in content, f"Unexpected dependency in {job_name}"
+            print(f"  ✓ {job_name}.pbs dependencies correct")
+        
+        # Single-threaded steps only reserve one core
+        assert '#PBS -l nodes=1:ppn=1' in (pbs_dir / 'LTR_INDEX.pbs').read_text()
+        assert '#PBS -l nodes=1:ppn=1' in (pbs_dir / 'LTR_COMBINE.pbs').read_text()
+        assert '#PBS -l nodes=1:ppn=32' in (pbs_dir / 'LTR_RETRIEVER.pbs').read_text()
+        print("  ✓ Per-step processor requests correct")
+        
+        assert 'if [ ! -s ' in (pbs_dir / 'LTR_RETRIEVER.pbs').read_text(), "LTR_retriever not guarded against empty input"
+        print("  ✓ LTR_retriever skipped when no LTR candidates were found")
+        
+        assert 'command -v LAI' not in (pbs_dir / 'LAI.pbs').read_text(), "LAI still probed in the job"
+        print("  ✓ LAI run without an in-job availability check")
+        
+        summary = (pbs_dir / 'SUMMARY.pbs').read_text()
+        assert '#PBS -W depend=afterany:' in summary, "SUMMARY job not held until the others end"
+        for job_id in ('TELOMERE_GAP.pbs01', 'QUAST.pbs01', 'LAI.pbs01'):
+            assert job_id in summary, f"SUMMARY job does not wait for {job_id}"
+        print("  ✓ SUMMARY job waits for all other jobs")
+
+
+def test_submit_many_dry_run():
+    """Test batched submission in dry-run mode"""
+    print("\nTesting batched job submission...")
+    
+    from genomeQC import PBSJobManager
+    
+    manager = PBSJobManager()
+    scripts = [Path('A.pbs'), Path('B.pbs')]
+    assert manager.submit_many(scripts, dry_run=True) == [None, None]
+    assert manager.submit_many([]) == []
+    
+    print("  ✓ Batched submission returns one result per script")
+
+
+def test_poll_all():
+    """Test that job states are read from a single qstat call"""
+    print("\nTesting batched job status polling...")
+    
+    from genomeQC import PBSJobManager
     
     with tempfile.TemporaryDirectory() as tmpdir:
-        genome_file = Path(tmpdir) / 'test.fasta'
-        genome_file.write_text(">seq1\nATCG\n")
+        # Stand-in qstat that records its arguments and reports one finished job
+        bin_dir = Path(tmpdir) / 'bin'
+        bin_dir.mkdir()
+        calls = Path(tmpdir) / 'calls'
+        qstat = bin_dir / 'qstat'
+        qstat.write_text(
+            '#!/bin/sh\n'
+            f'echo "$@" >> {calls}\n'
+            'echo \'{"Jobs": {"1.pbs01": {"job_state": "R"}, "2.pbs01": {"job_state": "F"}}}\'\n'
+        )
+        qstat.chmod(0o755)
         
-        output_dir = Path(tmpdir) / 'output'
+        old_path = os.environ.get('PATH', '')
+        os.environ['PATH'] = f"{bin_dir}{os.pathsep}{old_path}"
+        try:
+            manager = PBSJobManager()
+            assert manager.poll_all() == {}
+            manager.submitted_jobs = {'A': '1.pbs01', 'B': '2.pbs01', 'C': '3.pbs01'}
+            states = manager.poll_all()
+        finally:
+            os.environ['PATH'] = old_path
         
-        # Run with custom PBS parameters
-        result = subprocess.run([
-            PYTHON_EXE, 'genomeQC.py',
-            '-g', str(genome_file),
-            '-o', str(output_dir),
-            '-t', '60',
-            '-b', 'test_db',
-            '--cluster',
-            '--dry-run',
-            '--pbs-queue', 'high',
-            '--pbs-nodes', '1',
-            '--pbs-ppn', '60',
-            '--pbs-walltime', '240:00:00'
-        ], capture_output=True, text=True)
-        
-        assert result.returncode == 0
-        
-        # Check one script in detail
-        telomere_script = output_dir / 'pbs_scripts' / 'TELOMERE_GAP.pbs'
-        content = telomere_script.read_text()
-        
-        # Required elements from problem statement
-        required_elements = [
-            '#!/bin/bash',
-            '#PBS -N TELOMERE_GAP',
-            '#PBS -q high',
-            '#PBS -l nodes=1:ppn=60',
-            '#PBS -j oe',
-            '#PBS -l walltime=240:00:00',
-            'source ~/.bashrc',
-            'pwd',
-            'WD=`pwd`',
-            'mkdir -p $WD/log',
-            'TIME=`date +%m%d_%H%M`',
-            'exec > >(tee -a'
-        ]
-        
-        for element in required_elements:
-            assert element in content, f"Missing required element: {element}"
-        
-        print("  ✓ PBS script contains all required elements")
-
-
-def test_multiple_busco_databases():
-    """Test that multiple BUSCO databases generate separate jobs"""
-    print("\nTesting multiple BUSCO database jobs...")
+        assert states == {'A': 'R', 'B': 'F', 'C': 'F'}, f"Unexpected states: {states}"
+        assert calls.read_text().splitlines() == ['-x -f -F json 1.pbs01 2.pbs01 3.pbs01']
+        print("  ✓ All job states parsed from one qstat call")
+        
+        # A failing qstat is not "all finished": poll_all reports nothing and
+        # wait_all keeps polling until qstat answers
+        qstat.write_text(
+            '#!/bin/sh\n'
+            f'echo x >> {calls}\n'
+            f'if [ $(wc -l < {calls}) -lt 4 ]; then echo "qstat: server error" >&2; exit 2; fi\n'
+            'echo \'{"Jobs": {"1.pbs01": {"job_state": "F"}}}\'\n'
+        )
+        calls.write_text('')
+        os.environ['PATH'] = f"{bin_dir}{os.pathsep}{old_path}"
+        try:
+            assert manager.poll_all() == {}, "Failed qstat treated as finished jobs"
+            states = manager.wait_all(interval=0.01)
+        finally:
+            os.environ['PATH'] = old_path
+        
+        assert states == {'A': 'F', 'B': 'F', 'C': 'F'}, f"Unexpected states: {states}"
+        assert len(calls.read_text().splitlines()) == 4, "wait_all did not retry failed polls"
+    
+    print("  ✓ Failed qstat calls are retried instead of ending the wait")
+
+
+def test_emit_workflow():
+    """Test that cluster-mode jobs are written as a workflow instead of being submitted"""
+    print("\nTesting workflow emission...")
+    
+    from genomeQC import GenomeQC
     
     with tempfile.TemporaryDirectory() as tmpdir:
         genome_file = Path(tmpdir) / 'test.fasta'
-        genome_file.write_text(">seq\nATCG\n")
+        genome_file.write_text(">test\nATCG\n")
         
-        output_dir = Path(tmpdir) / 'output'
+        pipeline = GenomeQC(
+            genome_fasta=str(genome_file),
+            output_dir=str(Path(tmpdir) / 'output'),
+            threads=8,
+            busco_dbs=['db1', 'db2'],
+            cluster_mode=True,
+            dry_run=True
+        )
         
-        result = subprocess.run([
-            PYTHON_EXE, 'genomeQC.py',
-            '-g', str(genome_file),
-            '-o', str(output_dir),
-            '-t', '60',
-            '-b', 'db1', 'db2', 'db3',
-            '--cluster',
-            '--dry-run'
-        ], capture_output=True, text=True)
+        snakefile = pipeline.plan('snakemake').read_text()
+        assert 'rule BUSCO_1:' in snakefile and 'rule BUSCO_2:' in snakefile, "Array job not split per database"
+        assert 'input: "done/LTR_COMBINE.done"' in snakefile, "LTR_RETRIEVER not chained to LTR_COMBINE"
+        assert 'threads: 1' in snakefile, "Per-job core counts not carried over"
+        assert not list(pipeline.pbs_dir.iterdir()), "PBS scripts written while planning"
         
-        assert result.returncode == 0
+        script = (pipeline.output_dir / 'workflow' / 'scripts' / 'LTR_INDEX.sh').read_text()
+        assert script.startswith("#!/bin/bash\nset -eo pipefail\ncd ") and 'suffixerator' in script
+        print("  ✓ Snakefile rules, dependencies and job scripts written")
         
-        pbs_dir = output_dir / 'pbs_scripts'
+        nextflow = pipeline.plan('nextflow').read_text()
+        assert 'LTR_COMBINE(LTR_HARVEST.out.mix(LTR_FINDER.out).collect())' in nextflow
+        assert pipeline.plan('makeflow').name == 'genomeQC.makeflow'
+        print("  ✓ Nextflow and Makeflow workflows written")
         
-        # Check that separate jobs were created for each database
-        for db_name in ['db1', 'db2', 'db3']:
-            script_path = pbs_dir / f'BUSCO_{db_name}.pbs'
-            assert script_path.exists(), f"BUSCO job for {db_name} not created"
-            print(f"  ✓ BUSCO_{db_name}.pbs created")
+        # Local database names and output paths need not be valid identifiers or shell words
+        lineage = Path(tmpdir) / 'lineages' / 'fungi_odb10.2024-01'
+        lineage.mkdir(parents=True)
+        pipeline = GenomeQC(
+            genome_fasta=str(genome_file),
+            output_dir=str(Path(tmpdir) / 'run {1} $HOME'),
+            threads=8,
+            busco_dbs=[str(lineage)],
+            cluster_mode=True,
+            dry_run=True
+        )
+        script = pipeline.output_dir / 'workflow' / 'scripts' / 'BUSCO_fungi_odb10_2024_01.sh'
         
-        print("  ✓ Multiple BUSCO databases generate separate jobs")
-
-
-def main():
-    """Run all tests"""
-    print("=" * 60)
-    print("Running Cluster Mode Tests")
-    print("=" * 60)
-    
-    try:
-        test_cluster_mode_help()
-        test_pbs_script_generation()
-        test_pbs_script_content()
-        test_multiple_busco_databases()
+        snakefile = pipeline.plan('snakemake').read_text()
+        assert 'rule BUSCO_fungi_odb10_2024_01:' in snakefile, "Rule name not sanitised"
+        assert all(re.fullmatch(r'rule \w+:', line) for line in snakefile.splitlines()
+                   if line.startswith('rule ')), "Invalid rule name"
+        shell = next(line for line in snakefile.splitlines()
+                     if line.startswith('    shell:') and script.name in line)
+        command = ast.literal_eval(shell.split(':', 1)[1].strip()).format()
+        assert shlex.split(command) == ['bash', str(script)], f"Script path mangled: {command}"
         
-        print("\n" + "=" * 60)
-        print("All cluster mode tests passed! ✓")
-        print("=" * 60)
-        return 0
+        nextflow = pipeline.plan('nextflow').read_text()
+        assert 'process BUSCO_fungi_odb10_2024_01 {' in nextflow, "Process name not sanitised"
+        line = next(line for line in nextflow.splitlines() if script.name in line).strip()
+        assert '\\$HOME' in line, f"$ not escaped for Groovy: {line}"
+        command = re.sub(r'\\(.)', r'\1', line[1:-1])
+        assert shlex.split(command) == ['bash', str(script)], f"Script path mangled: {command}"
         
-    except AssertionError as e:
-        print(f"\n✗ Test failed: {e}")
-        import traceback
-        traceback.print_exc()
-        return 1
-    except Exception as e:
-        print(f"\n✗ Test error: {e}")
-        import traceback
-        traceback.print_exc()
-        return 1
+        makeflow = pipeline.plan('makeflow').read_text()
+        assert f"\tbash {shlex.quote(str(script))} &&" in makeflow, "Makeflow script path not quoted"
+        print("  ✓ Job names sanitised and script paths quoted for each engine")
 
 
 if __name__ == '__main__':
-    sys.exit(main())
+    sys.exit(pytest.main([__file__, '-v']))
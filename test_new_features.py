@@ -3,80 +3,54 @@
 Test script to validate new features added based on problem statement requirements
 """
 
+import json
+import os
 import sys
 import tempfile
-import subprocess
+import threading
+import time
 from pathlib import Path
 
+import pytest
+
 # Add the current directory to path
 sys.path.insert(0, str(Path(__file__).parent))
 
-from genomeQC import GenomeQC
+from genomeQC import GenomeQC, _available_memory
 
 
-def test_quartet_parameters():
+@pytest.mark.parametrize("organism_type,min_length", [('plant', 50), ('animal', 100)])
+def test_quartet_parameters(tmp_path, organism_type, min_length):
     """Test that quartet parameters are properly configured"""
     print("Testing quartet parameters...")
     
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.fasta', delete=False) as f:
-        f.write(">test_sequence\n")
-        f.write("ATCGATCGATCGATCG\n")
-        test_genome = f.name
+    genome_file = tmp_path / 'test.fasta'
+    genome_file.write_text(">test_sequence\nATCGATCGATCGATCG\n")
     
-    try:
-        with tempfile.TemporaryDirectory() as tmpdir:
-            # Test with plant organism type
-            pipeline = GenomeQC(
-                genome_fasta=test_genome,
-                output_dir=tmpdir,
-                threads=2,
-                busco_dbs=['eukaryota_odb10'],
-                organism_type='plant',
-                min_telomere_length=50
-            )
-            
-            assert pipeline.organism_type == 'plant', "Organism type not set correctly"
-            assert pipeline.min_telomere_length == 50, "Min telomere length not set correctly"
-            print(f"  ✓ Plant organism type: {pipeline.organism_type}")
-            print(f"  ✓ Min telomere length: {pipeline.min_telomere_length}")
-            
-            # Test with different organism type
-            pipeline2 = GenomeQC(
-                genome_fasta=test_genome,
-                output_dir=tmpdir + "_2",
-                threads=2,
-                busco_dbs=['eukaryota_odb10'],
-                organism_type='animal',
-                min_telomere_length=100
-            )
-            
-            assert pipeline2.organism_type == 'animal', "Animal organism type not set correctly"
-            assert pipeline2.min_telomere_length == 100, "Custom min telomere length not set correctly"
-            print(f"  ✓ Animal organism type: {pipeline2.organism_type}")
-            print(f"  ✓ Custom min telomere length: {pipeline2.min_telomere_length}")
-            
-    finally:
-        Path(test_genome).unlink()
+    pipeline = GenomeQC(
+        genome_fasta=str(genome_file),
+        output_dir=str(tmp_path / 'output'),
+        threads=2,
+        busco_dbs=['eukaryota_odb10'],
+        organism_type=organism_type,
+        min_telomere_length=min_length
+    )
     
+    assert pipeline.organism_type == organism_type, "Organism type not set correctly"
+    assert pipeline.min_telomere_length == min_length, "Min telomere length not set correctly"
+    print(f"  ✓ Organism type: {pipeline.organism_type}")
+    print(f"  ✓ Min telomere length: {pipeline.min_telomere_length}")
     print("  ✓ Quartet parameters test passed")
 
 
-def test_command_line_args():
+def test_command_line_args(help_text):
     """Test that command line arguments are properly supported"""
     print("\nTesting command-line arguments...")
     
-    # Test help with new parameters
-    result = subprocess.run(
-        ['python', 'genomeQC.py', '--help'],
-        capture_output=True,
-        text=True
-    )
-    
-    assert result.returncode == 0, "Help command failed"
-    assert '--organism-type' in result.stdout, "organism-type parameter not in help"
-    assert '--min-telomere-length' in result.stdout, "min-telomere-length parameter not in help"
-    assert 'plant' in result.stdout, "plant organism type not mentioned"
-    assert '--reads' in result.stdout, "reads parameter not in help"
+    assert '--organism-type' in help_text, "organism-type parameter not in help"
+    assert '--min-telomere-length' in help_text, "min-telomere-length parameter not in help"
+    assert 'plant' in help_text, "plant organism type not mentioned"
+    assert '--reads' in help_text, "reads parameter not in help"
     
     print("  ✓ organism-type parameter found in help")
     print("  ✓ min-telomere-length parameter found in help")
@@ -84,143 +58,372 @@ def test_command_line_args():
     print("  ✓ Command-line arguments test passed")
 
 
-def test_quartet_command_format():
+def test_quartet_command_format(tmp_path):
     """Test that quartet command format matches problem statement"""
     print("\nTesting quartet command format...")
     
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.fasta', delete=False) as f:
-        f.write(">test\nATCG\n")
-        test_genome = f.name
+    test_genome = tmp_path / 'test.fasta'
+    test_genome.write_text(">test\nATCG\n")
     
-    try:
-        with tempfile.TemporaryDirectory() as tmpdir:
-            pipeline = GenomeQC(
-                genome_fasta=test_genome,
-                output_dir=tmpdir,
-                threads=1,
-                busco_dbs=['test_db'],
-                organism_type='plant',
-                min_telomere_length=50
-            )
-            
-            # Check that the quartet command would be constructed correctly
-            genome_prefix = Path(test_genome).stem
-            expected_cmd_elements = [
-                'quartet.py',
-                'TeloExplorer',
-                '-i',
-                '-c', 'plant',
-                '-m', '50',
-                '-p', genome_prefix
-            ]
-            
-            # All elements should be present in expected command
-            for element in expected_cmd_elements:
-                print(f"  ✓ Expected command element: {element}")
-            
-    finally:
-        Path(test_genome).unlink()
+    pipeline = GenomeQC(
+        genome_fasta=str(test_genome),
+        output_dir=str(tmp_path / 'output'),
+        threads=1,
+        busco_dbs=['test_db'],
+        organism_type='plant',
+        min_telomere_length=50
+    )
+    
+    # Check that the quartet command would be constructed correctly
+    genome_prefix = test_genome.stem
+    expected_cmd_elements = [
+        'quartet.py',
+        'TeloExplorer',
+        '-i',
+        '-c', 'plant',
+        '-m', '50',
+        '-p', genome_prefix
+    ]
+    
+    # All elements should be present in expected command
+    for element in expected_cmd_elements:
+        print(f"  ✓ Expected command element: {element}")
     
     print("  ✓ Quartet command format test passed")
 
 
-def test_reads_parameter():
+def test_reads_parameter(tmp_path):
     """Test that reads parameter is properly handled"""
     print("\nTesting reads parameter...")
     
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.fasta', delete=False) as f:
-        f.write(">test\nATCG\n")
-        test_genome = f.name
+    test_genome = tmp_path / 'test.fasta'
+    test_genome.write_text(">test\nATCG\n")
+    test_reads1 = tmp_path / 'reads1.fastq'
+    test_reads1.write_text("@read1\nATCG\n+\nIIII\n")
+    test_reads2 = tmp_path / 'reads2.fastq'
+    test_reads2.write_text("@read2\nGCTA\n+\nIIII\n")
     
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.fastq', delete=False) as f:
-        f.write("@read1\nATCG\n+\nIIII\n")
-        test_reads1 = f.name
+    # Test without reads
+    pipeline = GenomeQC(
+        genome_fasta=str(test_genome),
+        output_dir=str(tmp_path / 'output'),
+        threads=1,
+        busco_dbs=['test_db'],
+        reads=None
+    )
     
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.fastq', delete=False) as f:
-        f.write("@read2\nGCTA\n+\nIIII\n")
-        test_reads2 = f.name
+    assert pipeline.reads is None, "Reads should be None when not provided"
+    print("  ✓ Pipeline accepts no reads (None)")
     
-    try:
-        with tempfile.TemporaryDirectory() as tmpdir:
-            # Test without reads
+    # Test with single reads file
+    pipeline2 = GenomeQC(
+        genome_fasta=str(test_genome),
+        output_dir=str(tmp_path / 'output_2'),
+        threads=1,
+        busco_dbs=['test_db'],
+        reads=[str(test_reads1)]
+    )
+    
+    assert pipeline2.reads is not None, "Reads should not be None"
+    assert len(pipeline2.reads) == 1, "Should have 1 reads file"
+    print("  ✓ Pipeline accepts single reads file")
+    
+    # Test with multiple reads files
+    pipeline3 = GenomeQC(
+        genome_fasta=str(test_genome),
+        output_dir=str(tmp_path / 'output_3'),
+        threads=1,
+        busco_dbs=['test_db'],
+        reads=[str(test_reads1), str(test_reads2)]
+    )
+    
+    assert pipeline3.reads is not None, "Reads should not be None"
+    assert len(pipeline3.reads) == 2, "Should have 2 reads files"
+    print("  ✓ Pipeline accepts multiple reads files")
+    
+    print("  ✓ Reads parameter test passed")
+
+
+def test_busco_db_resolution():
+    """Test that local BUSCO database directories are told apart from lineage names"""
+    print("\nTesting BUSCO database resolution...")
+    
+    with tempfile.TemporaryDirectory() as tmpdir:
+        genome_file = Path(tmpdir) / 'test.fasta'
+        genome_file.write_text(">test\nATCG\n")
+        local_db = Path(tmpdir) / 'eukaryota_odb10'
+        local_db.mkdir()
+        
+        pipeline = GenomeQC(
+            genome_fasta=str(genome_file),
+            output_dir=str(Path(tmpdir) / 'output'),
+            threads=1,
+            busco_dbs=[str(local_db), 'bacteria_odb10']
+        )
+        
+        resolved = pipeline._resolve_busco_dbs()
+        assert [is_local for _, _, is_local in resolved] == [True, False], \
+            "Local/remote BUSCO databases not resolved correctly"
+        assert resolved[0][1].name == 'eukaryota_odb10', "Local database path not kept"
+        print("  ✓ Local database directory detected")
+        print("  ✓ Remote lineage name kept as-is")
+    
+    print("  ✓ BUSCO database resolution test passed")
+
+
+def test_stage_graph():
+    """Test that direct-mode stages respect prerequisites and split threads by weight"""
+    print("\nTesting stage scheduling...")
+    
+    with tempfile.TemporaryDirectory() as tmpdir:
+        genome_file = Path(tmpdir) / 'test.fasta'
+        genome_file.write_text(">test\nATCG\n")
+        
+        pipeline = GenomeQC(
+            genome_fasta=str(genome_file),
+            output_dir=str(Path(tmpdir) / 'output'),
+            threads=8,
+            busco_dbs=['test_db']
+        )
+        
+        order = []
+        threads = {}
+        
+        def stage(name):
+            def run():
+                order.append(name)
+                threads[name] = pipeline._stage_threads()
+            return run
+        
+        for name in ('a', 'b', 'c'):
+            setattr(pipeline, f'run_{name}', stage(name))
+        pipeline.STAGE_GRAPH = {
+            'c': ('run_c', ('a',), 1),
+            'a': ('run_a', (), 3),
+            'b': ('run_b', (), 1)
+        }
+        pipeline._run_stage_graph()
+        
+        assert order.index('a') < order.index('c'), "Stage ran before its prerequisite"
+        assert threads['a'] == 6 and threads['b'] == 2, f"Threads not split by weight: {threads}"
+        assert pipeline._stage_threads() == 8, "Thread budget leaked out of the stage"
+        
+        # Used as a context manager, stages run on one pool that lives until exit
+        with pipeline:
+            executor = pipeline._executor
+            order.clear()
+            pipeline._run_stage_graph()
+            pipeline._run_stage_graph()
+            assert pipeline._executor is executor, "Stage pool not reused"
+        assert pipeline._executor is None, "Stage pool not shut down"
+        assert len(order) == 6, "Stages did not all run on the shared pool"
+        print("  ✓ Prerequisites finish first")
+        print("  ✓ Threads split by stage weight")
+        
+        # A failing stage is recorded; running stages finish, no new ones start
+        failed = threading.Event()
+        
+        def slow():
+            failed.wait(5)
+            time.sleep(0.05)
+            order.append('slow')
+        
+        def fail():
+            failed.set()
+            raise RuntimeError('boom')
+        
+        pipeline.run_slow = slow
+        pipeline.run_fail = fail
+        pipeline.STAGE_GRAPH = {
+            'slow': ('run_slow', (), 1),
+            'fail': ('run_fail', (), 1),
+            'c': ('run_c', ('slow',), 1)
+        }
+        order.clear()
+        with pytest.raises(RuntimeError, match='boom'):
+            pipeline._run_stage_graph()
+        assert order == ['slow'], f"Running stage not awaited or new stage started: {order}"
+        assert pipeline.results['fail'] == {'status': 'error', 'error': 'boom'}, "Failure not recorded"
+        print("  ✓ Stage failures recorded after running stages finish")
+
+
+def test_resume():
+    """Test that --resume skips stages that succeeded in the checkpointed run"""
+    print("\nTesting resume from checkpoint...")
+    
+    with tempfile.TemporaryDirectory() as tmpdir:
+        genome_file = Path(tmpdir) / 'test.fasta'
+        genome_file.write_text(">test\nATCG\n")
+        ran = []
+        
+        def make_pipeline(resume):
             pipeline = GenomeQC(
-                genome_fasta=test_genome,
-                output_dir=tmpdir,
-                threads=1,
-                busco_dbs=['test_db'],
-                reads=None
-            )
-            
-            assert pipeline.reads is None, "Reads should be None when not provided"
-            print("  ✓ Pipeline accepts no reads (None)")
-            
-            # Test with single reads file
-            pipeline2 = GenomeQC(
-                genome_fasta=test_genome,
-                output_dir=tmpdir + "_2",
-                threads=1,
+                genome_fasta=str(genome_file),
+                output_dir=str(Path(tmpdir) / 'output'),
+                threads=2,
                 busco_dbs=['test_db'],
-                reads=[test_reads1]
+                resume=resume
             )
             
-            assert pipeline2.reads is not None, "Reads should not be None"
-            assert len(pipeline2.reads) == 1, "Should have 1 reads file"
-            print("  ✓ Pipeline accepts single reads file")
+            def stage(name, status):
+                def run():
+                    ran.append(name)
+                    pipeline._set_result(name, {'status': status})
+                return run
             
-            # Test with multiple reads files
-            pipeline3 = GenomeQC(
-                genome_fasta=test_genome,
-                output_dir=tmpdir + "_3",
+            pipeline.run_a = stage('a', 'success')
+            pipeline.run_b = stage('b', 'failed')
+            pipeline.STAGE_GRAPH = {'a': ('run_a', (), 1), 'b': ('run_b', (), 1)}
+            return pipeline
+        
+        make_pipeline(False)._run_stage_graph()
+        assert (Path(tmpdir) / 'output' / '.state.json').exists(), "No checkpoint written"
+        
+        ran.clear()
+        pipeline = make_pipeline(True)
+        completed = pipeline._load_checkpoint()
+        pipeline._run_stage_graph(tuple(completed))
+        assert completed == ['a'] and ran == ['b'], f"Unexpected stages rerun: {ran}"
+        assert pipeline.results['a'] == {'status': 'success'}, "Checkpointed result not restored"
+        print("  ✓ Only failed stages run again")
+        
+        # A checkpoint taken while BUSCO is still running holds no partial BUSCO result
+        pipeline.busco_dbs = ['db1', 'db2']
+        pipeline._env = lambda *args, **kwargs: {'method': 'system', 'command': 'busco'}
+        pipeline._prefetch_busco_lineages = lambda busco_env, dbs: None
+        db1_done = threading.Event()
+        release = threading.Event()
+        
+        def fake_busco(busco_env, db, db_path, is_local, threads, download_path=None):
+            if db == 'db1':
+                db1_done.set()
+            else:
+                db1_done.wait(5)
+                release.wait(5)
+            return db, {'status': 'success'}
+        
+        pipeline._run_busco_single = fake_busco
+        busco = threading.Thread(target=pipeline.run_busco)
+        busco.start()
+        try:
+            assert db1_done.wait(5), "First BUSCO database did not run"
+            pipeline._checkpoint()
+            state = json.loads((Path(tmpdir) / 'output' / '.state.json').read_text())
+            assert 'busco' not in state, f"Partial BUSCO result checkpointed: {state.get('busco')}"
+        finally:
+            release.set()
+            busco.join()
+        pipeline._checkpoint()
+        state = json.loads((Path(tmpdir) / 'output' / '.state.json').read_text())
+        assert set(state['busco']) == {'db1', 'db2'}, f"BUSCO result incomplete: {state['busco']}"
+        print("  ✓ Checkpoints taken mid-stage only hold finished stage results")
+
+
+def test_available_memory():
+    """Test that available memory includes reclaimable page cache, not just free pages"""
+    print("\nTesting available memory...")
+    
+    available = _available_memory()
+    assert available is None or available > 0, f"Unexpected available memory: {available}"
+    if os.path.exists('/proc/meminfo'):
+        meminfo = dict(line.split(':', 1) for line in Path('/proc/meminfo').read_text().splitlines())
+        expected = int(meminfo['MemAvailable'].split()[0]) << 10
+        # MemAvailable moves a little between the two reads
+        assert abs(available - expected) < 256 << 20, f"Not MemAvailable: {available} vs {expected}"
+        print(f"  ✓ MemAvailable used: {available >> 20} MiB")
+
+
+
+def test_busco_job_mem(pipeline, monkeypatch):
+    """Test that the memory assumed per BUSCO run can be set from the environment"""
+    print("\nTesting BUSCO memory per run...")
+    
+    monkeypatch.delenv('GENOMEQC_BUSCO_MEM_GB', raising=False)
+    assert pipeline._busco_job_mem() == GenomeQC.BUSCO_JOB_MEM_GB << 30
+    monkeypatch.setenv('GENOMEQC_BUSCO_MEM_GB', '1.5')
+    assert pipeline._busco_job_mem() == 3 << 29
+    monkeypatch.setenv('GENOMEQC_BUSCO_MEM_GB', 'lots')
+    assert pipeline._busco_job_mem() == GenomeQC.BUSCO_JOB_MEM_GB << 30
+    print("  ✓ GENOMEQC_BUSCO_MEM_GB honoured")
+
+
+def test_count_gaps():
+    """Test in-process per-sequence N counting"""
+    print("\nTesting gap counting...")
+    
+    with tempfile.TemporaryDirectory() as tmpdir:
+        genome_file = Path(tmpdir) / 'test.fasta'
+        genome_file.write_text(">chr1 first\nACGTNN\nNNacgt\n>chr2\r\nnnAC\r\n>chr3\nACGT")
+        
+        pipeline = GenomeQC(
+            genome_fasta=str(genome_file),
+            output_dir=str(Path(tmpdir) / 'output'),
+            threads=1,
+            busco_dbs=['test_db']
+        )
+        
+        # A tiny chunk size also exercises counting across chunk boundaries
+        rows = pipeline._count_gaps(chunk=4).read_text().splitlines()
+        assert rows == ["#id\tlength\tN", "chr1\t12\t4", "chr2\t4\t2", "chr3\t4\t0"], rows
+        print("  ✓ Lengths and N counts per sequence correct")
+
+
+def test_stage_cache():
+    """Test that a successful stage is restored from --cache-dir instead of rerun"""
+    print("\nTesting stage cache...")
+    
+    with tempfile.TemporaryDirectory() as tmpdir:
+        genome_file = Path(tmpdir) / 'test.fasta'
+        genome_file.write_text(">test\nATCG\n")
+        calls = []
+        
+        def make_pipeline(output):
+            pipeline = GenomeQC(
+                genome_fasta=str(genome_file),
+                output_dir=str(Path(tmpdir) / output),
                 threads=1,
                 busco_dbs=['test_db'],
-                reads=[test_reads1, test_reads2]
+                cache_dir=str(Path(tmpdir) / 'cache')
             )
             
-            assert pipeline3.reads is not None, "Reads should not be None"
-            assert len(pipeline3.reads) == 2, "Should have 2 reads files"
-            print("  ✓ Pipeline accepts multiple reads files")
-            
-    finally:
-        Path(test_genome).unlink()
-        Path(test_reads1).unlink()
-        Path(test_reads2).unlink()
-    
-    print("  ✓ Reads parameter test passed")
-
-
-def main():
-    """Run all validation tests"""
-    print("=" * 60)
-    print("Running New Features Validation Tests")
-    print("=" * 60)
-    
-    try:
-        test_quartet_parameters()
-        test_command_line_args()
-        test_quartet_command_format()
-        test_reads_parameter()
-        
-        print("\n" + "=" * 60)
-        print("All validation tests passed! ✓")
-        print("=" * 60)
-        print("\nImplemented features:")
-        print("  • quartet.py TeloExplorer subcommand with -c, -m, -p parameters")
-        print("  • Organism type configuration (plant/animal/fungi/protist)")
-        print("  • Minimum telomere length configuration")
-        print("  • Enhanced LTR analysis pipeline with LTR_FINDER_parallel")
-        print("  • QUAST --large flag for large genomes")
-        print("  • Optional sequencing reads support (--reads parameter)")
-        print("  • Merqury QV calculation with reads")
-        print("  • Coverage analysis with minimap2 and mosdepth")
-        print("=" * 60)
-        return 0
-        
-    except Exception as e:
-        print(f"\n✗ Validation test failed with error: {e}")
-        import traceback
-        traceback.print_exc()
-        return 1
+            def run_quast():
+                calls.append(output)
+                (pipeline.quast_dir / 'report.txt').write_text("N50\t4\n")
+                pipeline.results['quast'] = {'status': 'success',
+                                             'report': str(pipeline.quast_dir / 'report.txt')}
+            pipeline.run_quast = run_quast
+            return pipeline
+        
+        make_pipeline('first')._run_stage_cached('quast', 'run_quast')
+        second = make_pipeline('second')
+        second._run_stage_cached('quast', 'run_quast')
+        
+        assert calls == ['first'], f"Cached stage was run again: {calls}"
+        assert (second.quast_dir / 'report.txt').read_text() == "N50\t4\n", "Output not restored"
+        assert second.results['quast']['report'] == str(second.quast_dir / 'report.txt'), \
+            "Cached result paths not moved to the new output directory"
+        print("  ✓ Cached stage restored into a new output directory")
+        
+        # A different genome must not hit the cache
+        genome_file.write_text(">test\nATCGATCG\n")
+        make_pipeline('third')._run_stage_cached('quast', 'run_quast')
+        assert calls == ['first', 'third'], "Cache entry reused for a changed genome"
+        print("  ✓ Changed input invalidates the cache entry")
+        
+        # Downloaded lineages are not copied into the cache entry
+        pipeline = make_pipeline('fourth')
+        
+        def run_busco():
+            (pipeline.busco_dir / 'busco_downloads' / 'lineages').mkdir(parents=True)
+            (pipeline.busco_dir / 'short_summary.txt').write_text("C:100.0%\n")
+            pipeline.results['busco'] = {'test_db': {'status': 'success'}}
+        pipeline.run_busco = run_busco
+        pipeline._run_stage_cached('busco', 'run_busco')
+        entry = Path(tmpdir) / 'cache' / pipeline._stage_cache_key('busco') / 'output'
+        assert (entry / 'short_summary.txt').exists(), "Report not cached"
+        assert not (entry / 'busco_downloads').exists(), "BUSCO downloads cached"
+        print("  ✓ Downloads left out of the cache entry")
 
 
 if __name__ == '__main__':
-    sys.exit(main())
+    sys.exit(pytest.main([__file__, '-v']))
@@ -4,6 +4,7 @@ Test script for genomeQC pipeline
 Verifies basic functionality without running full analyses
 """
 
+import os
 import sys
 import tempfile
 from pathlib import Path
@@ -11,7 +12,7 @@ from pathlib import Path
 # Add the current directory to path
 sys.path.insert(0, str(Path(__file__).parent))
 
-from genomeQC import EnvironmentManager, GenomeQC
+from genomeQC import EnvironmentManager, GenomeQC, _list_envs
 
 
 def test_environment_manager():
@@ -30,86 +31,157 @@ def test_environment_manager():
     available_modules = env_mgr._get_available_modules()
     print(f"  Available modules: {len(available_modules)}")
     
+    # Lookups are cached after the first query
+    env_mgr._env_exists('seqkit')
+    env_mgr._module_exists('seqkit')
+    assert isinstance(env_mgr._envs, dict), "Environment list not cached"
+    assert isinstance(env_mgr._modules, dict), "Module list not cached"
+    # Listings are shared by all managers in the process
+    _list_envs()
+    misses = _list_envs.cache_info().misses
+    assert EnvironmentManager()._get_existing_envs() == existing_envs, "Environment list differs"
+    assert _list_envs.cache_info().misses == misses, "Environment list queried again"
+    env_mgr.invalidate_cache()
+    assert env_mgr._envs is None and env_mgr._modules is None, "Cache not invalidated"
+    
+    # Streamed commands log all output but only keep the last lines in memory
+    with tempfile.TemporaryDirectory() as tmpdir:
+        log_file = Path(tmpdir) / 'tool.log'
+        script = "import sys\nfor i in range(5): print(i)\nsys.exit(3)"
+        result = env_mgr.run_command_streamed({'method': 'system'}, [sys.executable, '-c', script],
+                                              log_file, tail=2)
+        assert result.returncode == 3, "Exit status not returned"
+        assert result.stderr == "3\n4\n", f"Unexpected output tail: {result.stderr!r}"
+        assert log_file.read_text() == "0\n1\n2\n3\n4\n", "Output not fully logged"
+        
+        # Tools already on PATH are used directly, found by their executable name
+        fake_gt = Path(tmpdir) / 'gt'
+        fake_gt.write_text("#!/bin/sh\n")
+        fake_gt.chmod(0o755)
+        old_path = os.environ.get('PATH', '')
+        os.environ['PATH'] = f"{tmpdir}{os.pathsep}{old_path}"
+        try:
+            assert env_mgr.setup_software('genometools') == {'method': 'system', 'command': 'genometools'}
+        finally:
+            os.environ['PATH'] = old_path
+    
     print("  ✓ EnvironmentManager tests passed")
 
 
-def test_pipeline_init():
+def test_pipeline_init(pipeline):
     """Test pipeline initialization"""
     print("\nTesting Pipeline Initialization...")
     
-    # Create a temporary test genome file
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.fasta', delete=False) as f:
-        f.write(">test_sequence\n")
-        f.write("ATCGATCGATCGATCG\n")
-        test_genome = f.name
+    print(f"  Genome: {pipeline.genome_fasta}")
+    print(f"  Output: {pipeline.output_dir}")
+    print(f"  Threads: {pipeline.threads}")
+    print(f"  BUSCO DBs: {pipeline.busco_dbs}")
     
-    try:
-        # Create temporary output directory
-        with tempfile.TemporaryDirectory() as tmpdir:
+    # Check directories created
+    assert pipeline.telomere_dir.exists(), "Telomere dir not created"
+    assert pipeline.busco_dir.exists(), "BUSCO dir not created"
+    assert pipeline.quast_dir.exists(), "QUAST dir not created"
+    
+    print("  ✓ Pipeline initialization tests passed")
+
+
+def test_env_registry():
+    """Test that environment setup is cached and persisted per output directory"""
+    print("\nTesting Environment Registry...")
+    
+    with tempfile.TemporaryDirectory() as tmpdir:
+        genome_file = Path(tmpdir) / 'test.fasta'
+        genome_file.write_text(">test\nATCG\n")
+        output_dir = Path(tmpdir) / 'output'
+        calls = []
+        
+        def fake_setup(software_name, conda_package=None, channels=None):
+            calls.append(software_name)
+            if software_name == 'missing':
+                return {'method': 'system', 'command': software_name}
+            return {'method': 'env', 'name': software_name}
+        
+        installed = {'quast'}
+        
+        def make_pipeline(prefer_system=True):
             pipeline = GenomeQC(
-                genome_fasta=test_genome,
-                output_dir=tmpdir,
-                threads=2,
-                busco_dbs=['eukaryota_odb10']
+                genome_fasta=str(genome_file),
+                output_dir=str(output_dir),
+                threads=1,
+                busco_dbs=['test_db'],
+                prefer_system=prefer_system
             )
+            pipeline.env_manager.setup_software = fake_setup
+            pipeline.env_manager._env_exists = lambda name: name if name in installed else None
+            return pipeline
+        
+        for run in range(2):
+            pipeline = make_pipeline()
             
-            print(f"  Genome: {pipeline.genome_fasta}")
-            print(f"  Output: {pipeline.output_dir}")
-            print(f"  Threads: {pipeline.threads}")
-            print(f"  BUSCO DBs: {pipeline.busco_dbs}")
-            
-            # Check directories created
-            assert pipeline.telomere_dir.exists(), "Telomere dir not created"
-            assert pipeline.busco_dir.exists(), "BUSCO dir not created"
-            assert pipeline.quast_dir.exists(), "QUAST dir not created"
-            
-            print("  ✓ Pipeline initialization tests passed")
-    finally:
-        # Cleanup
-        Path(test_genome).unlink()
+            assert pipeline._env('quast', channels=['bioconda']) == {'method': 'env', 'name': 'quast'}
+            pipeline._env('quast', channels=['bioconda'])
+            pipeline._env('missing')
+        
+        # quast is set up once and then read back from .env_cache.json;
+        # the system fallback is not persisted and is retried on the next run
+        assert calls == ['quast', 'missing', 'missing'], f"Unexpected setup calls: {calls}"
+        assert (output_dir / '.env_cache.json').exists()
+        print("  ✓ Environments set up once and reused across runs")
+        
+        # Persisted environments that were removed, or a changed --prefer-env, are set up again
+        calls.clear()
+        installed.clear()
+        make_pipeline()._env('quast', channels=['bioconda'])
+        installed.add('quast')
+        make_pipeline(prefer_system=False)._env('quast', channels=['bioconda'])
+        assert calls == ['quast', 'quast'], f"Stale environment cache used: {calls}"
+        print("  ✓ Stale environment cache entries ignored")
+        
+        # Pre-warming resolves every needed environment once, skipping read-based stages
+        calls.clear()
+        pipeline._env_cache = {}
+        pipeline._prewarm_envs()
+        expected = {'busco', 'genometools', 'ltr_retriever', 'ltr_finder', 'quast'}
+        if not pipeline.check_quartet_available():
+            expected.add('seqkit')
+        assert sorted(calls) == sorted(expected), f"Unexpected pre-warmed environments: {calls}"
+        print("  ✓ Stage environments pre-warmed together")
 
 
-def test_quartet_check():
+def test_quartet_check(pipeline):
     """Test quartet availability check"""
     print("\nTesting Tool Availability Checks...")
     
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.fasta', delete=False) as f:
-        f.write(">test\nATCG\n")
-        test_genome = f.name
+    quartet_available = pipeline.check_quartet_available()
+    genomesyn_available = pipeline.check_genomesyn_available()
+    
+    print(f"  quartet available: {quartet_available}")
+    print(f"  GenomeSyn available: {genomesyn_available}")
     
+    # Availability comes from the startup scan, not a fresh PATH lookup
+    assert set(pipeline._tools) == set(GenomeQC.PROBED_TOOLS)
+    assert genomesyn_available == bool(pipeline._tools['GenomeSyn'])
+    
+    # --verify-tools additionally runs the tool with --help
+    assert not pipeline._tool_available('no-such-tool-xyz')
+    pipeline.verify_tools = True
     try:
-        with tempfile.TemporaryDirectory() as tmpdir:
-            pipeline = GenomeQC(
-                genome_fasta=test_genome,
-                output_dir=tmpdir,
-                threads=1,
-                busco_dbs=['test_db']
-            )
-            
-            quartet_available = pipeline.check_quartet_available()
-            genomesyn_available = pipeline.check_genomesyn_available()
-            
-            print(f"  quartet available: {quartet_available}")
-            print(f"  GenomeSyn available: {genomesyn_available}")
-            print("  ✓ Tool availability checks passed")
+        assert pipeline._tool_available(sys.executable)
+        assert not pipeline._tool_available('no-such-tool-xyz')
     finally:
-        Path(test_genome).unlink()
+        pipeline.verify_tools = False
+    print("  ✓ Tool availability checks passed")
 
 
 def test_help():
     """Test command line help"""
     print("\nTesting Command Line Interface...")
-    import subprocess
+    from genomeQC import build_parser
     
-    result = subprocess.run(
-        ['python', 'genomeQC.py', '--help'],
-        capture_output=True,
-        text=True
-    )
+    help_text = build_parser().format_help().lower()
     
-    assert result.returncode == 0, "Help command failed"
-    assert 'genome' in result.stdout.lower(), "Help text missing genome option"
-    assert 'busco' in result.stdout.lower(), "Help text missing busco option"
+    assert 'genome' in help_text, "Help text missing genome option"
+    assert 'busco' in help_text, "Help text missing busco option"
     
     print("  ✓ Command line interface tests passed")
 
@@ -122,8 +194,19 @@ def main():
     
     try:
         test_environment_manager()
-        test_pipeline_init()
-        test_quartet_check()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # One pipeline is shared by the tests that only inspect it (the `pipeline` fixture under pytest)
+            genome_file = Path(tmpdir) / 'test.fasta'
+            genome_file.write_text(">test_sequence\nATCGATCGATCGATCG\n")
+            pipeline = GenomeQC(
+                genome_fasta=str(genome_file),
+                output_dir=str(Path(tmpdir) / 'output'),
+                threads=2,
+                busco_dbs=['eukaryota_odb10']
+            )
+            test_pipeline_init(pipeline)
+            test_quartet_check(pipeline)
+        test_env_registry()
         test_help()
         
         print("\n" + "=" * 60)